@@ -0,0 +1,256 @@
+"""
+Many games of histo.newGame at once.
+
+newGame plays one shoe, one player and one round at a time through Player
+and Hand objects. Here numGames independent games move forward together:
+every round of every game is dealt at the same time, and each step of play
+is a handful of numpy operations over all the games that still need it.
+
+    (a) each game has its own shoe (a row of shoes) and cursor, and the
+        true count index after every card is precomputed per shoe as in histo.Shoe
+    (b) a round's hands live in fixed slots per game, with a stack of slot
+        ids playing the role of Player.playable (the top is the hand in play)
+    (c) decisions are read from a policy.StrategyTable for every game at once,
+        then hits, doubles, splits and stands are applied through masks
+    (d) the dealer draws for every game still short of 17 until none are
+
+The rules (rules.DEFAULT_RULES), betting and payouts are exactly those of newGame, so profits
+follow the same distribution; only the random streams differ (a single
+game, playGames(1, seed), is dealt exactly the shoes of
+newGame(np.random.default_rng(seed)) and ends with the same profit). A game can
+split into at most MAX_HANDS hands; a split beyond that plays the pair on
+its total instead. Every game holds its shoe followed by the next one, so
+a round that runs past the end of a shoe goes on into the next, as
+histo.Shoe.deal does, and the game carries on from there.
+Every step costs a fixed handful of numpy calls however many games take
+it, so throughput grows with numGames: tens of thousands of games play
+around half a million rounds a second on one core.
+"""
+import numpy as np
+import cards
+import policy
+from cards import ACE
+from stats import MIN_TC, MAX_TC
+from histo import BANKROLL, BETTING_UNIT, DECK_SIZE, HILO, SHOE_CARDS, BASIC_STRATEGY
+from rules import DEFAULT_RULES
+
+ROUNDS_PER_GAME = DEFAULT_RULES.roundsPerGame
+RESHUFFLE_AT = DEFAULT_RULES.reshuffleAt
+MAX_HANDS = 32
+SHOE_SIZE = len(SHOE_CARDS)
+
+
+"""
+plays numGames games of up to numRounds rounds following table (Basic
+Strategy by default), and returns the profit of each game (floored, as in
+histo.playGames) and the lowest bankroll each game reached
+"""
+def playGames(numGames, seed = None, table = None, numRounds = ROUNDS_PER_GAME):
+    rng = np.random.default_rng(seed)
+    if table is None:
+        table = BASIC_STRATEGY
+    actions = table.actions
+    surrender = table.surrender
+    insurance = table.insurance
+    games = np.arange(numGames)
+
+    # each game's shoe and then the next one, with the count starting over
+    # at the next one's first card (see kernel.pairShoes): tcs[g, i] is the
+    # true count index after i cards, and a shoe with no cards left counts
+    # as a fresh one, as in kernel._tcIndex
+    shoes = np.empty((numGames, 2*SHOE_SIZE), dtype=np.int8)
+    tcs = np.full((numGames, 2*SHOE_SIZE + 1), -MIN_TC, dtype=np.int8)
+    cursor = np.zeros(numGames, dtype=np.int64)
+    _shuffle(rng, games, shoes, tcs, 0)
+    _shuffle(rng, games, shoes, tcs, 1)
+    money = np.full(numGames, float(BANKROLL))
+    lowest = money.copy()
+    rounds = np.zeros(numGames, dtype=np.int64)
+
+    # the hands of the current round, one slot each
+    hard = np.zeros((numGames, MAX_HANDS), dtype=np.int64)
+    hasAce = np.zeros((numGames, MAX_HANDS), dtype=bool)
+    numCards = np.zeros((numGames, MAX_HANDS), dtype=np.int64)
+    firstCard = np.zeros((numGames, MAX_HANDS), dtype=np.int64)
+    secondCard = np.zeros((numGames, MAX_HANDS), dtype=np.int64)
+    bets = np.zeros((numGames, MAX_HANDS))
+    frozen = np.zeros((numGames, MAX_HANDS), dtype=bool)
+    numSlots = np.zeros(numGames, dtype=np.int64)
+    stack = np.zeros((numGames, MAX_HANDS), dtype=np.int64)
+    stackSize = np.zeros(numGames, dtype=np.int64)
+
+    def deal(g):
+        newCards = shoes[g, cursor[g]].astype(np.int64)
+        cursor[g] += 1
+        return newCards
+
+    def tcIndices(g, back = 0):
+        return tcs[g, cursor[g] - back]
+
+    while True:
+        a = np.flatnonzero((rounds < numRounds) & (money >= 0))
+        if len(a) == 0:
+            break
+        # games whose last round went on into the next shoe carry on there,
+        # and games down to the cut move on to it from its first card
+        moving = a[(cursor[a] > SHOE_SIZE) | (SHOE_SIZE - cursor[a] < RESHUFFLE_AT)]
+        if len(moving):
+            cursor[moving] = np.where(cursor[moving] > SHOE_SIZE, cursor[moving] - SHOE_SIZE, 0)
+            shoes[moving, :SHOE_SIZE] = shoes[moving, SHOE_SIZE:]
+            tcs[moving, :SHOE_SIZE + 1] = tcs[moving, SHOE_SIZE:]
+            _shuffle(rng, moving, shoes, tcs, 1)
+
+        # bets and the deal: the player's two cards, then the upCard and the hole card
+        bet = np.round(BETTING_UNIT/BANKROLL*money[a])
+        money[a] -= bet
+        card1, card2, upCard, holeCard = shoes[a[:, None], cursor[a, None] + np.arange(4)].astype(np.int64).T
+        cursor[a] += 4
+        # slots past the first are only read once a split has reset them
+        frozen[a, 0] = False
+        numSlots[a] = 1
+        hard[a, 0] = card1 + card2
+        hasAce[a, 0] = (card1 == ACE) | (card2 == ACE)
+        numCards[a, 0] = 2
+        firstCard[a, 0] = card1
+        secondCard[a, 0] = card2
+        bets[a, 0] = bet
+        stack[a, 0] = 0
+        stackSize[a] = 1
+        upCards = np.zeros(numGames, dtype=np.int64)
+        upCards[a] = upCard
+        roundGames = a
+
+        # insurance, at the count without the hole card; the dealer only checks for blackjack under an Ace
+        over = (upCard == ACE) & (holeCard == 10)
+        insured = (upCard == ACE) & insurance[tcIndices(a, 1)]
+        money[a[insured]] -= bet[insured]/2
+        money[a[insured & over]] += 3*(bet[insured & over]/2)
+        frozen[a[over], 0] = True
+        stackSize[a[over]] = 0
+        a = a[~over]
+        upCard = upCard[~over]
+        holeCard = holeCard[~over]
+
+        # surrender, for the initial hand only
+        soft = hasAce[a, 0] & (hard[a, 0] <= 11)
+        isPair = firstCard[a, 0] == secondCard[a, 0]
+        kind = np.where(isPair, policy.PAIR, soft.astype(np.int64))
+        index = np.where(isPair, firstCard[a, 0], np.where(soft, hard[a, 0] + 10, hard[a, 0]))
+        surrenders = surrender[kind, index, upCard, tcIndices(a)] & ~(soft & (hard[a, 0] == 11))
+        s = a[surrenders]
+        money[s] += bets[s, 0]/2
+        stackSize[s] = 0
+
+        # player play: each step, every game with a hand left acts on its top hand
+        while True:
+            g = a[stackSize[a] > 0]
+            if len(g) == 0:
+                break
+            top = stack[g, stackSize[g] - 1]
+            h, ace, n = hard[g, top], hasAce[g, top], numCards[g, top]
+            soft = ace & (h <= 11)
+            total = np.where(soft, h + 10, h)
+            isPair = (n == 2) & (firstCard[g, top] == secondCard[g, top])
+            kind = np.where(isPair, policy.PAIR, soft.astype(np.int64))
+            index = np.where(isPair, firstCard[g, top], np.minimum(total, 21))
+            canDouble = (n == 2).astype(np.int64)
+            tc = tcIndices(g)
+            action = actions[kind, index, upCards[g], canDouble, tc]
+            full = (action == policy.SPLIT) & (numSlots[g] == MAX_HANDS)
+            action[full] = actions[soft[full].astype(np.int64), total[full], upCards[g[full]], canDouble[full], tc[full]]
+            action[h > 21] = policy.STAND
+
+            hitting = (action == policy.HIT) | (action == policy.DOUBLE)
+            if hitting.any():
+                gh, th = g[hitting], top[hitting]
+                newCards = deal(gh)
+                hard[gh, th] += newCards
+                hasAce[gh, th] |= newCards == ACE
+                numCards[gh, th] += 1
+            doubling = action == policy.DOUBLE
+            gd, td = g[doubling], top[doubling]
+            money[gd] -= bets[gd, td]
+            bets[gd, td] *= 2
+            standing = (action == policy.STAND) | doubling
+            frozen[g[standing], top[standing]] = True
+            stackSize[g[standing]] -= 1
+
+            splitting = action == policy.SPLIT
+            if splitting.any():
+                gs, ts = g[splitting], top[splitting]
+                pairCard = firstCard[gs, ts]
+                cardA, cardB = deal(gs), deal(gs)
+                # the first new hand keeps the slot, the second goes on top of the stack
+                new = numSlots[gs]
+                numSlots[gs] += 1
+                for slot, newCard in ((ts, cardA), (new, cardB)):
+                    hard[gs, slot] = pairCard + newCard
+                    hasAce[gs, slot] = (pairCard == ACE) | (newCard == ACE)
+                    numCards[gs, slot] = 2
+                    firstCard[gs, slot] = pairCard
+                    secondCard[gs, slot] = newCard
+                    frozen[gs, slot] = False
+                bets[gs, new] = bets[gs, ts]
+                money[gs] -= bets[gs, ts]
+                stack[gs, stackSize[gs]] = new
+                stackSize[gs] += 1
+
+        # dealer play (standing on soft 17, as histo.dealerPlay)
+        dHard = upCard + holeCard
+        dAce = (upCard == ACE) | (holeCard == ACE)
+        dNumCards = np.full(len(a), 2)
+        while True:
+            hitting = np.where(dAce & (dHard <= 11), dHard + 10, dHard) < 17
+            if not hitting.any():
+                break
+            newCards = deal(a[hitting])
+            dHard[hitting] += newCards
+            dAce[hitting] |= newCards == ACE
+            dNumCards[hitting] += 1
+        # a round that ended on the deal was lost to a dealer blackjack
+        dScores = np.full(len(roundGames), cards.NATURAL)
+        dTotal = np.where(dAce & (dHard <= 11), dHard + 10, dHard)
+        dNatural = (dNumCards == 2) & dAce & (dHard == 11)
+        dScores[~over] = np.where(dHard > 21, cards.BUST, np.where(dNatural, cards.NATURAL, dTotal))
+
+        # settle every frozen hand, as histo.settleDebts. Most games play a
+        # single hand, so the first slot is settled for every game and the
+        # others only for the games that split (where a two card 21 is a plain 21)
+        r = roundGames
+        money[r] += frozen[r, 0]*_payouts(hard[r, 0], hasAce[r, 0], numCards[r, 0], bets[r, 0], dScores, numSlots[r] == 1)
+        split = numSlots[r] > 1
+        if split.any():
+            s = r[split]
+            width = numSlots[s].max()
+            pay = _payouts(hard[s, 1:width], hasAce[s, 1:width], numCards[s, 1:width], bets[s, 1:width],
+                           dScores[split, None], False)
+            live = frozen[s, 1:width] & (np.arange(1, width) < numSlots[s, None])
+            money[s] += (pay*live).sum(axis = 1)
+        lowest[r] = np.minimum(lowest[r], money[r])
+        rounds[r] += 1
+    return np.floor(money - BANKROLL), lowest
+
+"""
+what hands of hard total hard (with an Ace if ace), numCards cards and bet
+bets get back against dealer scores dScores; the two card 21s are
+blackjacks where natural is set
+"""
+def _payouts(hard, ace, numCards, bets, dScores, natural):
+    pScores = np.where(hard > 21, cards.BUST, np.where(ace & (hard <= 11), hard + 10, hard)).astype(float)
+    pScores[natural & (numCards == 2) & ace & (hard == 11)] = cards.NATURAL
+    return np.where(pScores == cards.NATURAL, np.where(dScores == cards.NATURAL, bets, 2.5*bets),
+           np.where(pScores == cards.BUST, 0,
+           np.where(pScores > dScores, 2*bets, np.where(pScores == dScores, bets, 0))))
+
+"""
+deals fresh shoes to the games g, as their shoe in play (half 0) or the next one (half 1)
+"""
+def _shuffle(rng, g, shoes, tcs, half):
+    if len(g) == 0:
+        return
+    cardSlice = slice(half*SHOE_SIZE, (half + 1)*SHOE_SIZE)
+    shoes[g, cardSlice] = rng.permuted(np.broadcast_to(SHOE_CARDS, (len(g), SHOE_SIZE)), axis = 1)
+    counts = np.cumsum(HILO[shoes[g, cardSlice]], axis = 1)
+    left = np.arange(SHOE_SIZE - 1, -1, -1)
+    trueCounts = np.where(left == 0, 0, counts)/(np.where(left == 0, SHOE_SIZE, left)/DECK_SIZE)
+    tcs[g, half*SHOE_SIZE + 1:(half + 1)*SHOE_SIZE + 1] = np.clip(np.floor(trueCounts), MIN_TC, MAX_TC) - MIN_TC
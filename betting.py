@@ -0,0 +1,132 @@
+"""
+How much to bet, by the true count.
+
+A BetSpread sizes every bet as
+
+    units[tc] + fractions[tc]*bankroll
+
+clamped to the table's minimum and maximum and rounded, where tc indexes
+the true count as stats.tcIndex. The two per-count arrays cover the usual
+spreads:
+
+    (a) proportionalRamp: a fraction of the bankroll scaled by a ramp of
+        multipliers (histo's flat bet is the ramp of all ones)
+    (b) unitRamp: a fixed number of betting units at each count
+    (c) kellySpread: (fractional) Kelly, the fraction of the bankroll the
+        EV and variance of a round at each count call for
+
+Like a policy.StrategyTable, the arrays are read back through lists, so
+sizing a bet in the play loop is two lookups and no allocation.
+
+The rest works out what a spread earns and risks from the per-count EV and
+variance (per unit bet) and the frequency of each count that an
+stats.OnlineStats gathers during a simulation: the EV and variance of a
+round, the risk of ruin of a bankroll and N0, the number of rounds it takes
+the expected win to reach one standard deviation.
+"""
+import math
+import numpy as np
+from stats import NUM_TCS
+
+
+class BetSpread:
+    def __init__(self, units = None, fractions = None, tableMin = 0, tableMax = math.inf):
+        self.units = np.zeros(NUM_TCS) if units is None else np.asarray(units, dtype = float)
+        self.fractions = np.zeros(NUM_TCS) if fractions is None else np.asarray(fractions, dtype = float)
+        if self.units.shape != (NUM_TCS,) or self.fractions.shape != (NUM_TCS,):
+            raise ValueError("a bet spread needs one entry for each of the " + str(NUM_TCS) + " true counts")
+        if tableMin > tableMax:
+            raise ValueError("the table minimum is above the table maximum")
+        self.tableMin = tableMin
+        self.tableMax = tableMax
+        self.compile()
+
+    """
+    Call again after changing the arrays.
+    """
+    def compile(self):
+        self.unitRows = self.units.tolist()
+        self.fractionRows = self.fractions.tolist()
+
+    """
+    the bet with bankroll money at the count with index tc
+    """
+    def bet(self, money, tc):
+        bet = self.unitRows[tc] + self.fractionRows[tc]*money
+        if bet < self.tableMin:
+            bet = self.tableMin
+        elif bet > self.tableMax:
+            bet = self.tableMax
+        return round(bet)
+
+    """
+    the bet at every count with bankroll money, as an array
+    """
+    def bets(self, money):
+        return np.round(np.clip(self.units + self.fractions*money, self.tableMin, self.tableMax))
+
+def proportionalRamp(ramp, fraction, tableMin = 0, tableMax = math.inf):
+    return BetSpread(fractions = fraction*np.asarray(ramp, dtype = float), tableMin = tableMin, tableMax = tableMax)
+
+def unitRamp(ramp, unit = 1, tableMin = 0, tableMax = math.inf):
+    return BetSpread(units = unit*np.asarray(ramp, dtype = float), tableMin = tableMin, tableMax = tableMax)
+
+"""
+bets kelly times the Kelly fraction of the bankroll at every count,
+ev/(variance + ev**2), and the table minimum where the count has no edge
+"""
+def kellySpread(ev, variance, kelly = 1.0, tableMin = 0, tableMax = math.inf):
+    ev = np.asarray(ev, dtype = float)
+    secondMoment = np.asarray(variance, dtype = float) + ev**2
+    fractions = np.where((ev > 0) & (secondMoment > 0), kelly*ev/np.maximum(secondMoment, 1e-12), 0.0)
+    return BetSpread(fractions = fractions, tableMin = tableMin, tableMax = tableMax)
+
+"""
+the frequency of every count and the EV and variance of a round per unit
+bet there, from an OnlineStats
+"""
+def countStats(stats):
+    rounds = stats.tcRounds
+    frequencies = rounds/max(rounds.sum(), 1)
+    variance = np.where(rounds > 1, stats.tcM2/np.maximum(rounds - 1, 1), 0.0)
+    return frequencies, stats.tcMean.copy(), variance
+
+"""
+the EV and variance of one round (in money) betting spread with bankroll money
+"""
+def spreadMoments(spread, frequencies, ev, variance, money):
+    bets = spread.bets(money)
+    mean = float(np.sum(frequencies*bets*ev))
+    secondMoment = float(np.sum(frequencies*bets**2*(variance + ev**2)))
+    return mean, secondMoment - mean**2
+
+"""
+the chance of ever losing bankroll, for a game whose rounds have the given
+EV and variance (the diffusion approximation). Bets that grow with the
+bankroll make this pessimistic, since they shrink as it falls.
+"""
+def riskOfRuin(mean, variance, bankroll):
+    if mean <= 0:
+        return 1.0
+    if variance <= 0:
+        return 0.0
+    return math.exp(-2*mean*bankroll/variance)
+
+def n0(mean, variance):
+    if mean == 0:
+        return math.inf
+    return variance/mean**2
+
+"""
+EV, standard deviation, risk of ruin and N0 of betting spread with the
+given bankroll, in a game measured by stats (an OnlineStats)
+"""
+def evaluate(spread, stats, bankroll):
+    frequencies, ev, variance = countStats(stats)
+    mean, var = spreadMoments(spread, frequencies, ev, variance, bankroll)
+    return {
+        "ev": mean,
+        "std": math.sqrt(max(var, 0.0)),
+        "riskOfRuin": riskOfRuin(mean, var, bankroll),
+        "n0": n0(mean, var),
+    }
@@ -0,0 +1,100 @@
+"""
+Card encoding and hand evaluation shared by histo.py and strategy.py.
+
+Cards are small ints: an Ace is 1 and every other card is its pip value
+(tens and face cards are all 10). A hand is summarized by the state
+(hardTotal, numAces, numCards), which is updated one card at a time with
+addCard. Everything else we want to know about a hand (its value, whether
+it is soft, bust or a blackjack) is then a table lookup on that state,
+so nobody has to re-scan the card list after every hit.
+
+Values follow the conventions already used by both modules:
+a blackjack is worth 21.5 and a busted hand is worth -1.
+"""
+
+ACE = 1
+TEN = 10
+RANKS = (ACE, 2, 3, 4, 5, 6, 7, 8, 9, TEN)
+DECK = 4*[ACE, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10]
+DECK_SIZE = 52
+
+NATURAL = 21.5
+BUST = -1
+
+# Hi-Lo count value of each card, indexed by card (index 0 is unused)
+HILO = (0, -1, 1, 1, 1, 1, 1, 0, 0, 0, -1)
+# the value of a single card, counting an Ace as 11
+CARD_VALUES = (0, 11, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+
+# The largest hard total we ever evaluate: hitting a hard 21 with a ten.
+MAX_HARD = 31
+EMPTY_HAND = (0, 0, 0)
+
+"""
+The lookup tables are indexed [hasAce][hardTotal].
+A hand with at least one Ace is soft when counting one Ace as 11 does not bust it.
+"""
+def _buildTables():
+    totals = ([], [])
+    soft = ([], [])
+    values = ([], [])
+    for hasAce in (0, 1):
+        for hard in range(MAX_HARD + 1):
+            isSoftHand = bool(hasAce) and hard <= 11
+            total = hard + 10 if isSoftHand else hard
+            totals[hasAce].append(total)
+            soft[hasAce].append(isSoftHand)
+            values[hasAce].append(BUST if total > 21 else total)
+    return totals, soft, values
+
+TOTALS, SOFT, VALUES = _buildTables()
+
+
+def encode(card):
+    if card == "A":
+        return ACE
+    return int(card)
+
+def decode(card):
+    if card == ACE:
+        return "A"
+    return card
+
+def addCard(state, card):
+    hard, numAces, numCards = state
+    if card == ACE:
+        return (hard + 1, numAces + 1, numCards + 1)
+    return (hard + card, numAces, numCards + 1)
+
+def handState(cardList):
+    numAces = cardList.count(ACE)
+    return (sum(cardList), numAces, len(cardList))
+
+def hardTotal(state):
+    return state[0]
+
+"""
+the best total of the hand, without any special treatment of blackjack or busting
+"""
+def total(state):
+    return TOTALS[state[1] > 0][state[0]]
+
+def isSoft(state):
+    return SOFT[state[1] > 0][state[0]]
+
+def isBust(state):
+    return state[0] > 21
+
+def isBlackjack(state):
+    return state[2] == 2 and state[1] == 1 and state[0] == 11
+
+"""
+21.5 for a blackjack, -1 for a bust, and the best total otherwise
+"""
+def value(state):
+    if state[2] == 2 and state[1] == 1 and state[0] == 11:
+        return NATURAL
+    return VALUES[state[1] > 0][state[0]]
+
+def cardValue(card):
+    return CARD_VALUES[card]
@@ -0,0 +1,116 @@
+"""
+Exact dealer outcome probabilities.
+
+Instead of replaying dealerPlay over sampled cards, we can work out the
+dealer's chances exactly from what is left in the shoe. A composition is
+a 10-tuple of card counts, where composition[rank - 1] is the number of
+cards of that rank left (Aces first, tens last).
+
+dealerProbabilities(upCard, composition) returns the probability of each
+of the dealer's final results, in the order of OUTCOMES:
+    17, 18, 19, 20, 21, bust, blackjack
+The hole card is drawn from the composition too, so a dealer blackjack is
+one of the outcomes rather than something we have already peeked for.
+Results are memoized on (dealer hand, composition), so sibling hands that
+leave the same cards in the shoe share their work.
+"""
+from functools import lru_cache
+import cards
+from cards import ACE, TEN
+
+OUTCOMES = (17, 18, 19, 20, 21, cards.BUST, cards.NATURAL)
+NUM_OUTCOMES = len(OUTCOMES)
+BUST_INDEX = 5
+BLACKJACK_INDEX = 6
+NO_OUTCOME = (0.0,)*NUM_OUTCOMES
+
+
+def fullShoe(numDecks):
+    return tuple(numDecks*cards.DECK.count(rank) for rank in cards.RANKS)
+
+def removeCards(composition, cardList):
+    counts = list(composition)
+    for card in cardList:
+        counts[card - 1] -= 1
+    return tuple(counts)
+
+"""
+A representative composition for a true count, for when we only know the
+count and not the cards. We start from decksLeft full decks and remove
+enough low cards (for a positive count) or high cards (for a negative one)
+to leave the shoe at that true count.
+"""
+def countComposition(trueCount, decksLeft = 3):
+    counts = list(fullShoe(decksLeft))
+    runningCount = int(round(trueCount*decksLeft))
+    if runningCount > 0:
+        removed = [2, 3, 4, 5, 6]
+    else:
+        removed = [TEN, TEN, TEN, TEN, ACE]
+    for i in range(abs(runningCount)):
+        rank = removed[i % len(removed)]
+        if counts[rank - 1] > 0:
+            counts[rank - 1] -= 1
+    return tuple(counts)
+
+"""
+probabilities of the dealer's final result, indexed like OUTCOMES.
+composition is what is left in the shoe once the upCard is out of it.
+"""
+@lru_cache(maxsize = 4096)
+def dealerProbabilities(upCard, composition, hitSoft17 = False):
+    return _drawFrom(upCard, int(upCard == ACE), True, composition, hitSoft17)
+
+"""
+the dealer's expected results from a hand with the given hard total,
+given whether it holds an Ace and whether it is still just the upCard
+"""
+@lru_cache(maxsize = 1 << 18)
+def _drawFrom(hard, hasAce, onlyUpCard, composition, hitSoft17):
+    remaining = sum(composition)
+    if remaining == 0:
+        return NO_OUTCOME
+    dist = [0.0]*NUM_OUTCOMES
+    for i in range(10):
+        count = composition[i]
+        if count == 0:
+            continue
+        p = count/remaining
+        rank = i + 1
+        newHard = hard + rank
+        newAce = int(hasAce or rank == ACE)
+        if onlyUpCard and newHard == 11 and newAce:
+            dist[BLACKJACK_INDEX] += p
+            continue
+        if newHard > 21:
+            dist[BUST_INDEX] += p
+            continue
+        total = cards.TOTALS[newAce][newHard]
+        if total > 17 or (total == 17 and not (hitSoft17 and cards.SOFT[newAce][newHard])):
+            dist[total - 17] += p
+        else:
+            counts = list(composition)
+            counts[i] -= 1
+            sub = _drawFrom(newHard, newAce, False, tuple(counts), hitSoft17)
+            for j in range(NUM_OUTCOMES):
+                dist[j] += p*sub[j]
+    return tuple(dist)
+
+"""
+expected profit per unit bet of standing on playerValue (a value as given
+by cards.value, so 21.5 is a blackjack and -1 a bust) against the dealer
+"""
+def standExpectation(playerValue, upCard, composition, hitSoft17 = False, payoff = 1.5):
+    if playerValue == cards.BUST:
+        return -1
+    dist = dealerProbabilities(upCard, composition, hitSoft17)
+    won = 0.0
+    lost = 0.0
+    for outcome, p in zip(OUTCOMES, dist):
+        if playerValue > outcome:
+            won += p
+        elif playerValue < outcome:
+            lost += p
+    if playerValue == cards.NATURAL:
+        return payoff*won - lost
+    return won - lost
@@ -65,50 +65,191 @@ This gives the main structure of play
 
 # Useful Modules
 from functools import reduce
-import random
+from concurrent.futures import ProcessPoolExecutor
 import math
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-
-# Global variables
-NUM_DECKS = 6
+import cards
+import policy
+from rules import DEFAULT_RULES
+import betting
+from stats import OnlineStats, loadStats, MIN_TC, MAX_TC, NUM_TCS
+from cards import ACE
+
+# Global variables (the rules of the game live in rules.py)
+NUM_DECKS = DEFAULT_RULES.decks
 DECK_SIZE = 52
 BANKROLL = 1000
 BETTING_UNIT = 1
 LOW_CARDS = [2,3,4,5,6]
-HIGH_CARDS = ["A", 10]
-
-
-def histogram(numIters):
-    data = []
-    for i in range(numIters):
-        profit = np.floor(newGame() - 1000)
-        data.append(profit)
-        print(i)
-    upper = max(data)
-    lower = min(data)
-    plt.hist(data, range = (lower, upper), bins = int((upper - lower)/5), rwidth = 0.9)
+HIGH_CARDS = [ACE, 10]
+
+# The shoe stores cards as int8 codes (see cards.py)
+HILO = np.array(cards.HILO, dtype=np.int8)
+SHOE_CARDS = np.array(NUM_DECKS*cards.DECK, dtype=np.int8)
+RNG = np.random.default_rng()
+# games are simulated in chunks of this size, each with its own RNG stream,
+# so a seeded run gives the same profits no matter how many workers it uses
+GAMES_PER_CHUNK = 250
+BASIC_STRATEGY = policy.basicStrategy()
+# BETTING_UNIT for every BANKROLL the player has, whatever the count
+FLAT_SPREAD = betting.proportionalRamp(np.ones(NUM_TCS), BETTING_UNIT/BANKROLL)
+
+
+"""
+Simulates numIters games of the auto player and returns
+(profits, summary), where profits is a numpy array of the profit
+of each game and summary holds its basic statistics.
+The games are sharded across numWorkers processes (all cores by default)
+and every shard draws from its own stream spawned from seed.
+table and rules set the strategy played and the game's rules, and spread
+(a betting.BetSpread) sizes the bets, FLAT_SPREAD by default. Given a
+shoebank.ShoeBank, the games are dealt the bank's shoes instead of
+shuffling, each chunk starting at its own share of the bank.
+"""
+def histogram(numIters, numWorkers = None, seed = None, plot = False, table = None, rules = DEFAULT_RULES, spread = None, bank = None):
+    chunkSizes = [GAMES_PER_CHUNK]*(numIters // GAMES_PER_CHUNK)
+    if numIters % GAMES_PER_CHUNK:
+        chunkSizes.append(numIters % GAMES_PER_CHUNK)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunkSizes))
+    numChunks = len(chunkSizes)
+    starts = bankStarts(bank, numChunks, rules)
+    if numWorkers is None:
+        numWorkers = os.cpu_count()
+    if numWorkers <= 1 or numChunks <= 1:
+        chunks = [playGames(chunkSizes[i], seeds[i], table, rules, spread, bank, starts[i]) for i in range(numChunks)]
+    else:
+        with ProcessPoolExecutor(max_workers = numWorkers) as pool:
+            chunks = list(pool.map(playGames, chunkSizes, seeds, [table]*numChunks, [rules]*numChunks, [spread]*numChunks,
+                                   [bank]*numChunks, starts))
+    profits = np.concatenate(chunks) if chunks else np.zeros(0)
+    summary = summarize(profits)
+    if plot:
+        plotProfits(profits)
+    return profits, summary
+
+"""
+where each of numChunks chunks starts reading bank: evenly spread over it,
+so the chunks share no shoes unless the bank is too small for them
+"""
+def bankStarts(bank, numChunks, rules = DEFAULT_RULES):
+    if bank is None:
+        return [0]*numChunks
+    if bank.decks != rules.decks:
+        raise ValueError("the shoe bank holds " + str(bank.decks) + "-deck shoes, but the rules play " + str(rules.decks))
+    return [i*len(bank)//numChunks for i in range(numChunks)]
+
+"""
+plays numGames independent games with an RNG built from seedSequence, or
+with the shoes of bank from start on.
+With numba installed, flat-betting games under the default rules run through
+the compiled kernel in kernel.py, which gives the same results as newGame.
+"""
+def playGames(numGames, seedSequence, table = None, rules = DEFAULT_RULES, spread = None, bank = None, start = 0):
+    import kernel
+    rng = np.random.default_rng(seedSequence) if bank is None else bank.stream(start)
+    profits = np.empty(numGames)
+    for i in range(numGames):
+        if kernel.HAVE_NUMBA and rules == DEFAULT_RULES and spread is None:
+            money = kernel.playGame(rng, table)
+        else:
+            money = newGame(rng, table = table, rules = rules, spread = spread)
+        profits[i] = np.floor(money - BANKROLL)
+    return profits
+
+"""
+Like histogram, but nothing is kept per game: every chunk of games feeds
+an OnlineStats accumulator and the chunks are merged as they finish, so
+memory stays constant however large numIters is. If checkpoint is a path,
+the merged statistics are saved there every checkpointEvery chunks, and a
+later call with the same numIters, seed and checkpoint resumes from it.
+A bank is dealt from as in histogram.
+"""
+def streamGames(numIters, numWorkers = None, seed = None, checkpoint = None, checkpointEvery = 20, statsConfig = {}, table = None,
+                rules = DEFAULT_RULES, spread = None, bank = None):
+    chunkSizes = [GAMES_PER_CHUNK]*(numIters // GAMES_PER_CHUNK)
+    if numIters % GAMES_PER_CHUNK:
+        chunkSizes.append(numIters % GAMES_PER_CHUNK)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunkSizes))
+    starts = bankStarts(bank, len(chunkSizes), rules)
+    total = OnlineStats(**statsConfig)
+    if checkpoint is not None and os.path.exists(checkpoint):
+        total = loadStats(checkpoint)
+    start = total.chunksDone
+    if numWorkers is None:
+        numWorkers = os.cpu_count()
+
+    def record(chunk):
+        total.merge(chunk)
+        if checkpoint is not None and total.chunksDone % checkpointEvery == 0:
+            total.save(checkpoint)
+
+    if numWorkers <= 1:
+        for i in range(start, len(chunkSizes)):
+            record(playGamesOnline(chunkSizes[i], seeds[i], statsConfig, table, rules, spread, bank, starts[i]))
+    else:
+        # keep only a few chunks in flight so pending results don't pile up
+        with ProcessPoolExecutor(max_workers = numWorkers) as pool:
+            pending = []
+            for i in range(start, len(chunkSizes)):
+                pending.append(pool.submit(playGamesOnline, chunkSizes[i], seeds[i], statsConfig, table, rules, spread, bank, starts[i]))
+                if len(pending) >= 2*numWorkers:
+                    record(pending.pop(0).result())
+            for future in pending:
+                record(future.result())
+    if checkpoint is not None:
+        total.save(checkpoint)
+    return total
+
+def playGamesOnline(numGames, seedSequence, statsConfig = {}, table = None, rules = DEFAULT_RULES, spread = None, bank = None, start = 0):
+    rng = np.random.default_rng(seedSequence) if bank is None else bank.stream(start)
+    stats = OnlineStats(**statsConfig)
+    for i in range(numGames):
+        newGame(rng, stats, table, rules, spread)
+    stats.chunksDone = 1
+    return stats
+
+def summarize(profits):
+    numGames = len(profits)
+    if numGames == 0:
+        return {"games": 0}
+    std = profits.std(ddof = 1) if numGames > 1 else 0.0
+    return {
+        "games": numGames,
+        "mean": float(profits.mean()),
+        "std": float(std),
+        "stdErr": float(std/math.sqrt(numGames)),
+        "median": float(np.median(profits)),
+        "min": float(profits.min()),
+        "max": float(profits.max()),
+        "probLoss": float(np.mean(profits < 0)),
+    }
+
+def plotProfits(profits):
+    import matplotlib.pyplot as plt
+    upper = max(profits)
+    lower = min(profits)
+    plt.hist(profits, range = (lower, upper), bins = max(1, int((upper - lower)/5)), rwidth = 0.9)
     plt.show()
 
-def newGame():
+def newGame(rng = RNG, stats = None, table = None, rules = DEFAULT_RULES, spread = None):
     # Create and shuffle the shoe of cards
-    suits = ["A", 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10]
-    deck = 4*suits
-    shoeList = NUM_DECKS*deck
-    random.shuffle(shoeList)
-    shoe = Shoe(shoeList, 0)
+    shoe = newShoe(rng, rules)
     # create the player and the dealer 
     p1 = Player("auto")
+    p1.table = table
+    p1.rules = rules
+    if spread is not None:
+        p1.spread = spread
     dealer = Player(True)
     # begin play
     rounds = 0
-    while rounds < 1000:
+    lowest = p1.money
+    while rounds < rules.roundsPerGame:
         if p1.money < 0:
             break
-        if shoe.getNumCards() < 26:
-            shoeList = NUM_DECKS*deck
-            random.shuffle(shoeList)
-            shoe = Shoe(shoeList, 0)
+        if shoe.getNumCards() < rules.reshuffleAt:
+            shoe.reshuffle()
 
         bet = takeBets(p1, shoe)
         dealCards(shoe, p1, dealer, bet)
@@ -116,45 +257,112 @@ def newGame():
         roundOver = checkInsurance(p1, dealer, shoe)
         if not roundOver:
             playerPlay(shoe, p1, upCard)
-            dealerPlay(shoe, dealer)
-        settleDebts(dealer, p1)
+            dealerPlay(shoe, dealer, rules)
+        settleDebts(dealer, p1, stats)
         resetHands(dealer, p1)
+        lowest = min(lowest, p1.money)
         rounds += 1
+    if stats is not None:
+        stats.addGame(math.floor(p1.money - BANKROLL), lowest)
     return p1.money
 """
-A pile of cards equipped with a count
+returns a freshly shuffled shoe of rules.decks decks, which draws the
+shoes after it from rng as well
+"""
+def newShoe(rng = RNG, rules = DEFAULT_RULES):
+    shoeCards = SHOE_CARDS if rules.decks == NUM_DECKS else np.array(rules.decks*cards.DECK, dtype=np.int8)
+    def shuffled():
+        return rng.permutation(shoeCards)
+    return Shoe(shuffled(), 0, shuffled)
+
+"""
+converts a list of cards ("A"/1 or 2-10) into the shoe's int8 codes
+"""
+def encodeCards(cardList):
+    if isinstance(cardList, np.ndarray):
+        return cardList.astype(np.int8, copy = False)
+    return np.array([cards.encode(card) for card in cardList], dtype=np.int8)
+
+"""
+A pile of cards equipped with a count.
+The cards live in an int8 array and are dealt by advancing a cursor.
+runningCounts[i] holds the Hi-Lo count after i cards have been dealt,
+so the count never has to be updated card by card. Both are built with
+numpy once per shoe and read back through plain lists, which index faster
+than numpy scalars inside the play loop.
+Given a source of shuffled shoes (see newShoe), the next shoe is drawn from
+it as soon as this one is, and reshuffle moves on to it.
 """
 class Shoe:
-    def __init__(self, cardList, rCount = 0):
-        self.cards = cardList
-        self.rCount = rCount
+    def __init__(self, cardList, rCount = 0, source = None):
+        self.source = source
+        self.spare = None if source is None else source()
+        self.load(cardList, rCount)
+
+    def load(self, cardList, rCount = 0):
+        self.cards = encodeCards(cardList)
+        self.cursor = 0
+        self.order = self.cards.tolist()
+        counts = np.zeros(len(self.cards) + 1, dtype=np.int64)
+        counts[1:] = np.cumsum(HILO[self.cards])
+        counts += rCount
+        self.runningCounts = counts.tolist()
+        # the true count's stats.tcIndex after every card, as getTrue would give it
+        decksLeft = np.maximum(len(self.cards) - np.arange(len(self.cards) + 1), 1)/DECK_SIZE
+        trueCounts = counts/decksLeft
+        trueCounts[-1] = counts[0]/(len(self.cards)/DECK_SIZE)
+        self.tcIndices = (np.clip(np.floor(trueCounts), MIN_TC, MAX_TC) - MIN_TC).astype(np.int64).tolist()
 
     def getNumCards(self):
-        return len(self.cards)
+        return len(self.cards) - self.cursor
     
+    """
+    moves on to the next shoe, and draws the one after it
+    """
+    def reshuffle(self):
+        self.load(self.spare)
+        self.spare = self.source()
+
+    """
+    A round that runs past the end of the shoe goes on with the next shoe,
+    the same one reshuffle would move on to
+    """
     def deal(self):
-        topCard = self.cards[0]
-        self.cards = self.cards[1:]
-        if topCard in LOW_CARDS:
-            self.rCount += 1
-        if topCard in HIGH_CARDS:
-            self.rCount -= 1
+        if self.cursor == len(self.order):
+            if self.source is None:
+                raise ValueError("the shoe ran out of cards in the middle of a round")
+            self.reshuffle()
+        topCard = self.order[self.cursor]
+        self.cursor += 1
         return topCard
 
     def getCount(self):
-        return self.rCount
+        return self.runningCounts[self.cursor]
     
+    def getTcIndex(self):
+        return self.tcIndices[self.cursor]
+
     def getTrue(self):
+        if self.cursor == len(self.order):
+            return self.runningCounts[0]/(len(self.order)/DECK_SIZE)
         numDecks = self.getNumCards()/DECK_SIZE
         return self.getCount()/numDecks
 
+"""
+A hand keeps its cards for display and splitting, but all of its
+evaluation goes through the incremental state from cards.py
+"""
 class Hand:
-    def __init__(self, cardList, bet):
+    def __init__(self, cardList, bet, fromSplit = False):
         self.cards = cardList
+        self.state = cards.handState(cardList)
         self.bet = bet
+        # a two card 21 on a hand from a split is a plain 21, not a blackjack
+        self.fromSplit = fromSplit
     
     def addCard(self, newCard):
         self.cards += [newCard]
+        self.state = cards.addCard(self.state, newCard)
     
     def changeBetTo(self, newBet):
         self.bet = newBet
@@ -165,25 +373,11 @@ class Hand:
     def getCards(self):
         return self.cards
 
-    def getValue(self, someCards):
-        if someCards == []:
-            return 0
-        #copy needs to be a deepCopy, since we change things
-        copy = [element for element in someCards]
-        numAces = 0
-        while "A" in copy:
-            numAces += 1
-            copy.remove("A")
-        if numAces == 0:
-            return copy[0] + self.getValue(copy[1:])
-        else:
-            hardValue = numAces - 1 + self.getValue(copy)
-            highValue = hardValue + 11
-            lowValue = hardValue + 1
-            if highValue <= 21:
-                return highValue
-            else:
-                return lowValue
+    def getState(self):
+        return self.state
+
+    def getValue(self):
+        return cards.total(self.state)
 
 """
 we want to be able to make a player split, hit, and double down.
@@ -195,6 +389,15 @@ class Player:
         self.frozen = []
         self.money = BANKROLL
         self.bettingUnit = BETTING_UNIT
+        # what the player had before betting this round, what they bet and at what count
+        self.roundStart = self.money
+        self.roundBet = 0
+        self.roundTc = 0
+        # the StrategyTable an "auto" player follows (None for Basic Strategy)
+        self.table = None
+        self.rules = DEFAULT_RULES
+        # the betting.BetSpread sizing the player's bets
+        self.spread = FLAT_SPREAD
 
     """
     removes hand from playing queue
@@ -214,8 +417,8 @@ class Player:
     """
     adds a new hand to the front of the playable hands
     """
-    def addHandtoFront(self, cardList, bet):
-        newHand = Hand(cardList, bet)
+    def addHandtoFront(self, cardList, bet, fromSplit = False):
+        newHand = Hand(cardList, bet, fromSplit)
         self.playable = [newHand] + self.playable
     """
     clears all hands and bets
@@ -253,10 +456,12 @@ class Player:
         if len(currentCards) == 2:
             if currentCards[0] == currentCards[1]:
                 self.deleteHand(currentHand)
+                # the second hand takes a bet of its own
+                self.changeMoney(-currentHand.getBet())
                 for i in range(0,2):
                     newCards = [currentCards[i], shoe.deal()]
                     bet = currentHand.getBet()
-                    self.addHandtoFront(newCards, bet)
+                    self.addHandtoFront(newCards, bet, True)
     def surrender(self):
         firstHand = self.getHand()
         self.changeMoney(firstHand.getBet()/2)
@@ -264,11 +469,11 @@ class Player:
 
 
 def takeBets(player, shoe):
-    prop = BETTING_UNIT/BANKROLL
-    bet = prop*player.money
-    # if shoe.getTrue() > 1:
-    #     bet *= shoe.getTrue()
-    bet = round(bet)
+    tc = shoe.getTcIndex()
+    bet = player.spread.bet(player.money, tc)
+    player.roundStart = player.money
+    player.roundBet = bet
+    player.roundTc = tc
     player.changeMoney(-bet)
     return bet
     
@@ -280,7 +485,7 @@ def dealCards(shoe, player, dealer, bet):
 def checkInsurance(player, dealer, shoe):
     upCard = dealer.getHand().getCards()[0]
     holeCard = dealer.getHand().getCards()[1]
-    if upCard == "A":
+    if upCard == ACE:
         if player.playerType == "human":
             print("the dealer's upcard is an Ace")
             insurance = 0
@@ -294,6 +499,13 @@ def checkInsurance(player, dealer, shoe):
             else:
                 return False
         elif player.playerType == "auto":
+            table = player.table if player.table is not None else policy.basicStrategy(player.rules)
+            # the hole card is face down, so the count leaves it out
+            if table.insures(shoe.tcIndices[shoe.cursor - 1]):
+                insurance = player.getHand().getBet()/2
+                player.changeMoney(-insurance)
+                if holeCard == 10:
+                    player.changeMoney(3*insurance)
             if holeCard == 10:
                 player.stand()
                 return True
@@ -304,13 +516,13 @@ def playerPlay(shoe, player, upCard):
     if player.playerType == "human":
         humanPlay(shoe, player,upCard)
     elif player.playerType == "auto":
-        autoPlay(shoe, player, upCard)
+        autoPlay(shoe, player, upCard, player.table)
 
 def humanPlay(shoe, player, upCard):
-    print('the dealer\'s upcard is ' + str(upCard))
+    print('the dealer\'s upcard is ' + str(cards.decode(upCard)))
     print("")
     print("your current hand is:")
-    print(player.getHand().getCards())
+    print([cards.decode(card) for card in player.getHand().getCards()])
     print("")
     decision = input("will you surrender? (y/n)")
     if "y" in decision:
@@ -320,14 +532,14 @@ def humanPlay(shoe, player, upCard):
     while player.playable != []:
         #First, check if the hand is bust:
         currentHand = player.getHand()
-        if currentHand.getValue(currentHand.getCards()) > 21:
+        if cards.isBust(currentHand.getState()):
             player.stand()
         # Now, we play
         else:
-            print('the dealer\'s upcard is ' + str(upCard))
+            print('the dealer\'s upcard is ' + str(cards.decode(upCard)))
             print("")
             print("your current hand is:")
-            print(player.getHand().getCards())
+            print([cards.decode(card) for card in player.getHand().getCards()])
             print("")
             decision = input("will you hit (h), double down (dd), stand (st) or split (sp)?")
             if decision == "h":
@@ -339,21 +551,24 @@ def humanPlay(shoe, player, upCard):
             elif decision == "sp":
                 player.split(shoe)
 
-def dealerPlay(shoe, dealer):
+def dealerPlay(shoe, dealer, rules = DEFAULT_RULES):
     dHand = dealer.getHand()
-    while dHand.getValue(dHand.getCards()) < 17:
+    while dHand.getValue() < 17 or (rules.hitSoft17 and dHand.getValue() == 17 and cards.isSoft(dHand.getState())):
         dealer.hit(shoe)
 
-def settleDebts(dealer, player):
-    dCards = dealer.getHand().getCards()
-    dScore = value(dCards)
+"""
+pays out every frozen hand, and records the round's profit in stats if given one
+"""
+def settleDebts(dealer, player, stats = None):
+    dScore = cards.value(dealer.getHand().getState())
     for hand in player.frozen:
-        pCards = hand.getCards()
-        pScore = value(pCards)
+        pScore = cards.value(hand.getState())
+        if pScore == 21.5 and hand.fromSplit:
+            pScore = 21
         if pScore == 21.5:
             if dScore != 21.5:
                 #Blackjack!
-                player.money += 2.5*hand.getBet()
+                player.money += (1 + player.rules.blackjackPayout)*hand.getBet()
                 # print("")
                 # print("BLACKJACK - you win $" + str(1.5*hand.getBet()))
             else:
@@ -361,7 +576,7 @@ def settleDebts(dealer, player):
                 player.money += hand.getBet()
                 # print("")
                 # print("PUSH - no money won or lost")
-        elif value(pCards) == -1:
+        elif pScore == -1:
             # print("")
             # print("BUST - YOU LOSE $" + str(hand.getBet()))
             continue
@@ -377,157 +592,56 @@ def settleDebts(dealer, player):
             # print("")
             # print("Dealer wins - you lose $" + str(hand.getBet()))
             continue
+    if stats is not None:
+        stats.addRound(player.money - player.roundStart, player.roundBet, player.roundTc)
+
 
 def sumCards(cardList):
-    copy = [card for card in cardList]
-    numAces = 0
-    while "A" in copy:
-        numAces += 1
-        copy.remove("A")
-    partialSum = sum(copy)
-    if numAces == 0:
-        return partialSum
-
-    partialSum += numAces - 1
-    if partialSum < 11:
-        return partialSum + 11
-    else:
-        return partialSum + 1
+    return cards.total(cards.handState(cardList))
 
 def value(cardList):
-    if cardList == ["A", 10] or cardList == [10, "A"]:
-        return 21.5
-    naiveSum = sumCards(cardList)
-    if naiveSum > 21:
-        return -1
-    return naiveSum
+    return cards.value(cards.handState(cardList))
 
 def resetHands(dealer, player):
     player.clearhands()
     dealer.clearhands()
 """
-plays according to Basic Strategy - A mess of conditionals
+plays according to a StrategyTable (Basic Strategy unless told otherwise):
+every decision is one lookup on the hand, the upCard and the true count.
+Count-dependent plays are index plays compiled into the table (see
+policy.withIndexPlays and policy.BASIC_INDEX_PLAYS), not conditionals here.
 """
-def autoPlay(shoe, player, upCard):
-    pCards = player.getHand().getCards()
+def autoPlay(shoe, player, upCard, table = None):
+    rules = player.rules
+    if table is None:
+        table = policy.basicStrategy(rules)
+    hand = player.getHand()
     #surrender conditions - for initial Hand ONLY
-    if value(pCards) == 16 and isSoft(pCards) == False:
-        if upCard in [9,10, "A"]:
-            player.surrender()
-    if value(pCards) == 15 and isSoft(pCards) == False:
-        if upCard == 10:
-            player.surrender()
-
+    if rules.surrender != "none" and table.surrenders(hand.getState(), hand.getCards(), upCard, shoe.getTcIndex()):
+        player.surrender()
 
     #Makes decisions until all hands are frozen
     while player.playable != []:
-        pCards = player.getHand().getCards()
+        hand = player.getHand()
+        state = hand.getState()
         # check if busted surtout
-        if value(pCards) < 0:
+        if cards.isBust(state):
             player.stand()
             continue
-        # PAIR SPLITTING
-        if len(pCards) == 2 and pCards[0] == pCards[1]:
-            card = pCards[0]
-            if card == "A":
-                player.split(shoe)
-                continue
-            if card == 10:
-                if upCard in [4,5,6]:
-                    if upCard + shoe.getCount() >= 10:
-                        player.split(shoe)
-            if card == 9:
-                if upCard in [2,3,4,5,6,8,9]:
-                    player.split(shoe)
-                    continue
-            if card == 8:
-                player.split(shoe)
-                continue
-            if card in [6,7]:
-                if value([upCard]) <= card:
-                    player.split(shoe)
-                    continue
-            if card == 4:
-                if upCard in [4,5]:
-                    player.split(shoe)
-                    continue
-            if card in [2,3]:
-                if value([upCard]) < 8:
-                    player.split(shoe)
-                    continue
-        #SOFT TOTALS
-        if isSoft(pCards):
-            total = value(pCards)
-            if total > 19:
-                player.stand()
-            elif total == 19:
-                if upCard == 6:
-                    player.doubleDown(shoe)
-                else:
-                    player.stand()
-            elif total == 18:
-                if value([upCard]) > 8:
-                    player.hit(shoe)
-                elif upCard > 6:
-                    player.stand()
-                elif len(pCards) > 2:
-                    player.stand()
-                else:
-                    player.doubleDown(shoe)
-            elif total == 17:
-                if upCard in [3,4,5,6]:
-                    player.doubleDown(shoe)
-                else:
-                    player.hit(shoe)
-            elif total in [15,16]:
-                if upCard in [4,5,6]:
-                    player.doubleDown(shoe)
-                else:
-                    player.hit(shoe)
-            elif total in [13,14]:
-                if upCard in [5,6]:
-                    player.doubleDown(shoe)
-                else:
-                    player.hit(shoe)
-        #HARD TOTALS
+        # once the player has split, the rules may limit further splits and doubles
+        pCards = hand.getCards()
+        numHands = len(player.playable) + len(player.frozen)
+        canSplit = rules.canSplit(pCards[0], numHands)
+        canDouble = numHands == 1 or rules.doubleAfterSplit
+        action = table.action(state, pCards, upCard, shoe.getTcIndex(), canSplit, canDouble)
+        if action == policy.STAND:
+            player.stand()
+        elif action == policy.HIT:
+            player.hit(shoe)
+        elif action == policy.DOUBLE:
+            player.doubleDown(shoe)
         else:
-            total = value(pCards)
-            if total > 16:
-                player.stand()
-            elif total > 12:
-                if value([upCard]) > 6:
-                    player.hit(shoe)
-                else:
-                    player.stand()
-            elif total == 12:
-                if upCard in [4,5,6]:
-                    player.stand()
-                else:
-                    player.hit(shoe)
-            elif total == 11:
-                player.doubleDown(shoe)
-            elif total == 10:
-                if value([upCard]) > 9:
-                    player.hit(shoe)
-                else:
-                    player.doubleDown(shoe)
-            elif total == 9:
-                if upCard in [3,4,5,6]:
-                    player.doubleDown(shoe)
-                else:
-                    player.hit(shoe)
-            else:
-                player.hit(shoe)
+            player.split(shoe)
 
 def isSoft(pCards):
-    copy = [card for card in pCards]
-    if "A" in copy:
-        copy.remove("A")
-        score = 0
-        while "A" in copy:
-            score += 1
-            copy.remove("A")
-        score += sum(copy)
-        return score < 11
-    return False
-        
+    return cards.isSoft(cards.handState(pCards))
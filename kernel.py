@@ -0,0 +1,267 @@
+"""
+A compiled round loop for histo.newGame.
+
+newGame spends nearly all of its time in dealCards, checkInsurance,
+autoPlay, dealerPlay and settleDebts, moving Python objects around for
+every card. _playShoe does the same work for every round of one shoe over
+plain integer arrays: the shoe, its running counts, and a
+policy.StrategyTable's arrays. With numba installed it is compiled with
+njit; without it, the same function runs as ordinary Python (slowly), so
+nothing here requires numba.
+
+Every shoe is played together with the next one (the shoe and its running
+counts are followed by those of the next), so a round that runs past the
+end of a shoe goes on into the next one as histo.Shoe.deal does, and then
+_playShoe stops for the caller to move on to it.
+
+playGame deals its shoes from rng exactly as newGame does and gives the
+same result for the same seed, under rules.DEFAULT_RULES (the kernel
+plays only those rules). histo.playGames uses it automatically
+when numba is available (HAVE_NUMBA), and parityCheck compares the
+compiled kernel, the uncompiled one and newGame on a range of seeds.
+"""
+import numpy as np
+import policy
+from cards import ACE
+from stats import MIN_TC, MAX_TC
+from histo import BANKROLL, BETTING_UNIT, DECK_SIZE, HILO, SHOE_CARDS, BASIC_STRATEGY, newGame
+from rules import DEFAULT_RULES
+
+try:
+    from numba import njit
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+ROUNDS_PER_GAME = DEFAULT_RULES.roundsPerGame
+RESHUFFLE_AT = DEFAULT_RULES.reshuffleAt
+# a round can split into at most this many hands; a split beyond it plays the pair on its total
+MAX_HANDS = 32
+NATURAL = 21.5
+BUST = -1.0
+
+
+"""
+plays one game of numRounds rounds like newGame, dealing shoes from rng,
+and returns the final bankroll. jit = False runs the kernel uncompiled.
+"""
+def playGame(rng, table = None, numRounds = ROUNDS_PER_GAME, jit = True):
+    if table is None:
+        table = BASIC_STRATEGY
+    playShoe = _playShoe if jit else getattr(_playShoe, "py_func", _playShoe)
+    money = float(BANKROLL)
+    lowest = money
+    rounds = 0
+    cursor = 0
+    shoe = rng.permutation(SHOE_CARDS)
+    while True:
+        spare = rng.permutation(SHOE_CARDS)
+        shoes, countSums = pairShoes(shoe, spare)
+        money, lowest, rounds, cursor = playShoe(shoes, countSums, cursor, money, lowest, rounds, numRounds,
+                                                 table.actions, table.surrender, table.insurance)
+        if rounds >= numRounds or money < 0:
+            return money
+        # carry on in the next shoe where the last round left it, or reshuffle
+        cursor = cursor - len(shoe) if cursor > len(shoe) else 0
+        shoe = spare
+
+"""
+a shoe followed by the next one, as _playShoe takes them: the cards of
+both, and the running count after every card, which starts over at the
+first card of the next shoe
+"""
+def pairShoes(shoe, spare):
+    size = len(shoe)
+    shoes = np.concatenate([shoe, spare]).astype(np.int64)
+    countSums = np.zeros(2*size + 1, dtype=np.int64)
+    countSums[1:size + 1] = np.cumsum(HILO[shoe])
+    countSums[size + 1:] = np.cumsum(HILO[spare])
+    return shoes, countSums
+
+"""
+checks that the compiled kernel, the uncompiled kernel and newGame end
+every game with the same bankroll, for the seeds 0 to numGames - 1.
+Returns the seeds that disagree.
+"""
+def parityCheck(numGames = 20, numRounds = ROUNDS_PER_GAME):
+    mismatches = []
+    for seed in range(numGames):
+        expected = newGame(np.random.default_rng(seed))
+        compiled = playGame(np.random.default_rng(seed), numRounds = numRounds)
+        uncompiled = playGame(np.random.default_rng(seed), numRounds = numRounds, jit = False)
+        if not expected == compiled == uncompiled:
+            mismatches.append(seed)
+    return mismatches
+
+@njit(cache = True)
+def _deal(shoe, cursor):
+    return shoe[cursor], cursor + 1
+
+"""
+the index of the true count after cursor cards of a pair of shoes of size
+cards each (see pairShoes): a shoe with no cards left counts as a fresh one
+"""
+@njit(cache = True)
+def _tcIndex(countSums, cursor, size):
+    left = size - cursor if cursor <= size else 2*size - cursor
+    if left == 0:
+        trueCount = countSums[0]/(size/DECK_SIZE)
+    else:
+        trueCount = countSums[cursor]/(left/DECK_SIZE)
+    tc = int(np.floor(trueCount))
+    if tc < MIN_TC:
+        tc = MIN_TC
+    elif tc > MAX_TC:
+        tc = MAX_TC
+    return tc - MIN_TC
+
+"""
+plays rounds from the first of a pair of shoes (see pairShoes) from cursor
+on until it is down to its last RESHUFFLE_AT cards, a round has gone on
+into the second, or the game is over, and returns the updated
+(money, lowest, rounds, cursor)
+"""
+@njit(cache = True)
+def _playShoe(shoe, countSums, cursor, money, lowest, rounds, numRounds, actions, surrender, insurance):
+    size = len(shoe)//2
+    hard = np.zeros(MAX_HANDS, dtype=np.int64)
+    hasAce = np.zeros(MAX_HANDS, dtype=np.bool_)
+    numCards = np.zeros(MAX_HANDS, dtype=np.int64)
+    firstCard = np.zeros(MAX_HANDS, dtype=np.int64)
+    secondCard = np.zeros(MAX_HANDS, dtype=np.int64)
+    bets = np.zeros(MAX_HANDS)
+    frozen = np.zeros(MAX_HANDS, dtype=np.bool_)
+    stack = np.zeros(MAX_HANDS, dtype=np.int64)
+    while rounds < numRounds and money >= 0 and size - cursor >= RESHUFFLE_AT:
+        # takeBets and dealCards
+        bet = float(round(BETTING_UNIT/BANKROLL*money))
+        money -= bet
+        card1, cursor = _deal(shoe, cursor)
+        card2, cursor = _deal(shoe, cursor)
+        upCard, cursor = _deal(shoe, cursor)
+        holeCard, cursor = _deal(shoe, cursor)
+        frozen[:] = False
+        hard[0] = card1 + card2
+        hasAce[0] = card1 == ACE or card2 == ACE
+        numCards[0] = 2
+        firstCard[0] = card1
+        secondCard[0] = card2
+        bets[0] = bet
+        numSlots = 1
+        stack[0] = 0
+        stackSize = 1
+
+        # checkInsurance: the dealer only checks for blackjack under an Ace,
+        # and the count the player insures at leaves out the hole card
+        if upCard == ACE and insurance[_tcIndex(countSums, cursor - 1, size)]:
+            insured = bet/2
+            money -= insured
+            if holeCard == 10:
+                money += 3*insured
+        roundOver = upCard == ACE and holeCard == 10
+        if roundOver:
+            frozen[0] = True
+            stackSize = 0
+        elif not (hasAce[0] and hard[0] == 11):
+            soft = hasAce[0] and hard[0] <= 11
+            if card1 == card2:
+                surrenders = surrender[policy.PAIR, card1, upCard, _tcIndex(countSums, cursor, size)]
+            elif soft:
+                surrenders = surrender[policy.SOFT, hard[0] + 10, upCard, _tcIndex(countSums, cursor, size)]
+            else:
+                surrenders = surrender[policy.HARD, hard[0], upCard, _tcIndex(countSums, cursor, size)]
+            if surrenders:
+                money += bet/2
+                stackSize = 0
+
+        # autoPlay
+        while stackSize > 0:
+            top = stack[stackSize - 1]
+            if hard[top] > 21:
+                frozen[top] = True
+                stackSize -= 1
+                continue
+            soft = hasAce[top] and hard[top] <= 11
+            total = hard[top] + 10 if soft else hard[top]
+            canDouble = 1 if numCards[top] == 2 else 0
+            tc = _tcIndex(countSums, cursor, size)
+            if canDouble == 1 and firstCard[top] == secondCard[top]:
+                action = actions[policy.PAIR, firstCard[top], upCard, 1, tc]
+                if action == policy.SPLIT and numSlots == MAX_HANDS:
+                    action = actions[1 if soft else 0, total, upCard, 1, tc]
+            else:
+                action = actions[1 if soft else 0, total, upCard, canDouble, tc]
+
+            if action == policy.STAND:
+                frozen[top] = True
+                stackSize -= 1
+            elif action == policy.HIT or action == policy.DOUBLE:
+                newCard, cursor = _deal(shoe, cursor)
+                hard[top] += newCard
+                hasAce[top] = hasAce[top] or newCard == ACE
+                numCards[top] += 1
+                if action == policy.DOUBLE:
+                    money -= bets[top]
+                    bets[top] *= 2
+                    frozen[top] = True
+                    stackSize -= 1
+            else:
+                # the first new hand keeps the slot, the second goes on top of the stack
+                pairCard = firstCard[top]
+                new = numSlots
+                numSlots += 1
+                bets[new] = bets[top]
+                money -= bets[top]
+                for slot in (top, new):
+                    newCard, cursor = _deal(shoe, cursor)
+                    hard[slot] = pairCard + newCard
+                    hasAce[slot] = pairCard == ACE or newCard == ACE
+                    numCards[slot] = 2
+                    firstCard[slot] = pairCard
+                    secondCard[slot] = newCard
+                    frozen[slot] = False
+                stack[stackSize] = new
+                stackSize += 1
+
+        # dealerPlay, standing on soft 17
+        dHard = upCard + holeCard
+        dAce = upCard == ACE or holeCard == ACE
+        dNumCards = 2
+        if not roundOver:
+            while (dHard + 10 if dAce and dHard <= 11 else dHard) < 17:
+                newCard, cursor = _deal(shoe, cursor)
+                dHard += newCard
+                dAce = dAce or newCard == ACE
+                dNumCards += 1
+        if dNumCards == 2 and dAce and dHard == 11:
+            dScore = NATURAL
+        elif dHard > 21:
+            dScore = BUST
+        else:
+            dScore = float(dHard + 10 if dAce and dHard <= 11 else dHard)
+
+        # settleDebts: after a split, a two card 21 is a plain 21
+        for slot in range(numSlots):
+            if not frozen[slot]:
+                continue
+            if numSlots == 1 and numCards[slot] == 2 and hasAce[slot] and hard[slot] == 11:
+                if dScore != NATURAL:
+                    money += 2.5*bets[slot]
+                else:
+                    money += bets[slot]
+                continue
+            if hard[slot] > 21:
+                continue
+            pScore = float(hard[slot] + 10 if hasAce[slot] and hard[slot] <= 11 else hard[slot])
+            if pScore > dScore:
+                money += 2*bets[slot]
+            elif pScore == dScore:
+                money += bets[slot]
+        if money < lowest:
+            lowest = money
+        rounds += 1
+    return money, lowest, rounds, cursor
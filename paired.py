@@ -0,0 +1,228 @@
+"""
+Comparing strategies on the same shoes.
+
+Two strategies simulated on independent shoes differ by far less than the
+luck of their deals, so telling an EV difference of 0.1% apart takes
+enormous samples. Here every strategy plays the identical sequence of
+shoes, one unit a round with no bankroll to lose, and what is compared is
+the difference shoe by shoe, most of the luck cancelling out.
+
+The shoes are generated in one of three modes:
+
+    (a) "plain": independent shuffles
+    (b) "antithetic": every shuffle is followed by the same shoe reversed,
+        whose running count at every depth is minus the first shoe's count
+        at the mirrored depth, so good and bad counts come in pairs
+    (c) "stratified": the shoes are split by the Hi-Lo count of the cards
+        behind the cut (the last RESHUFFLE_AT, which are never played), clamped
+        to +-MAX_STRATUM, with every stratum getting its share of the shoes
+        exactly and the shoes in it shuffled at random given that count
+
+compare reports each strategy's EV per round and its difference from the
+first strategy, with standard errors that account for the pairing, the
+antithetic pairs and the strata, and the unpaired standard error the same
+difference would have had on independent shoes. Given a target, it keeps
+adding shoes until every difference is known to within it.
+
+Shoes are played by kernel._playShoe (compiled when numba is available), so
+the games follow rules.DEFAULT_RULES.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from math import comb
+from statistics import NormalDist
+import os
+import numpy as np
+import kernel
+from histo import BANKROLL, HILO, SHOE_CARDS
+from kernel import RESHUFFLE_AT
+
+MODES = ("plain", "antithetic", "stratified")
+SHOE_SIZE = len(SHOE_CARDS)
+# shoes are made and played in chunks of this size, each from its own spawned seed
+SHOES_PER_CHUNK = 500
+MAX_STRATUM = 8
+
+
+"""
+Plays every table on the same shoes and returns a dictionary of numpy
+arrays, one entry per table: the rounds played, the EV per round and its
+standard error, and the difference from tables[0] with its standard error,
+the standard error it would have had unpaired, and its confidence interval.
+numShoes shoes are played, or with a target, batches of numShoes until
+every interval is at most target either side (or maxShoes are played).
+"""
+def compare(tables, numShoes, seed = None, mode = "plain", numWorkers = None, confidence = 0.95, target = None, maxShoes = None):
+    if mode not in MODES:
+        raise ValueError("mode must be one of " + str(MODES) + ", not " + repr(mode))
+    seedSequence = np.random.SeedSequence(seed)
+    if numWorkers is None:
+        numWorkers = os.cpu_count()
+    z = NormalDist().inv_cdf((1 + confidence)/2)
+    chunks = []
+    while True:
+        chunkSizes = [SHOES_PER_CHUNK]*(numShoes // SHOES_PER_CHUNK)
+        if numShoes % SHOES_PER_CHUNK:
+            chunkSizes.append(numShoes % SHOES_PER_CHUNK)
+        seeds = seedSequence.spawn(len(chunkSizes))
+        numChunks = len(chunkSizes)
+        if numWorkers <= 1 or numChunks <= 1:
+            chunks += [playChunk(chunkSize, s, tables, mode) for chunkSize, s in zip(chunkSizes, seeds)]
+        else:
+            with ProcessPoolExecutor(max_workers = numWorkers) as pool:
+                chunks += list(pool.map(playChunk, chunkSizes, seeds, [tables]*numChunks, [mode]*numChunks))
+        report = summarize(chunks, z)
+        if target is None or (report["high"] - report["low"]).max() <= 2*target:
+            return report
+        if maxShoes is not None and report["shoes"] + numShoes > maxShoes:
+            return report
+
+"""
+the report of compare, from the chunks played so far
+"""
+def summarize(chunks, z = NormalDist().inv_cdf(0.975)):
+    profits = np.concatenate([chunk[0] for chunk in chunks], axis = 1)
+    rounds = np.concatenate([chunk[1] for chunk in chunks], axis = 1)
+    strata = np.concatenate([chunk[2] for chunk in chunks])
+    # antithetic pairs are numbered within their chunk; make the blocks unique across chunks
+    offsets = np.cumsum([0] + [chunk[3].max() + 1 for chunk in chunks[:-1]])
+    blocks = np.concatenate([chunk[3] + offset for chunk, offset in zip(chunks, offsets)])
+
+    totalRounds = rounds.sum(axis = 1)
+    ev = profits.sum(axis = 1)/totalRounds
+    # each shoe's contribution to the ratio estimate ev, linearized
+    influence = (profits - ev[:, None]*rounds)/rounds.mean(axis = 1)[:, None]
+    stdErr = np.array([blockedStdErr(x, strata, blocks) for x in influence])
+    differenceStdErr = np.array([blockedStdErr(x - influence[0], strata, blocks) for x in influence])
+    difference = ev - ev[0]
+    return {
+        "shoes": profits.shape[1],
+        "rounds": totalRounds,
+        "ev": ev,
+        "stdErr": stdErr,
+        "difference": difference,
+        "differenceStdErr": differenceStdErr,
+        "unpairedStdErr": np.sqrt(stdErr**2 + stdErr[0]**2),
+        "low": difference - z*differenceStdErr,
+        "high": difference + z*differenceStdErr,
+    }
+
+"""
+the standard error of the mean of x over the shoes, where shoes in the
+same block (an antithetic pair) are averaged first and the blocks are
+weighted by stratum
+"""
+def blockedStdErr(x, strata, blocks):
+    numBlocks = blocks.max() + 1
+    sizes = np.bincount(blocks, minlength = numBlocks)
+    means = np.bincount(blocks, x, minlength = numBlocks)/np.maximum(sizes, 1)
+    blockStrata = np.zeros(numBlocks, dtype = strata.dtype)
+    blockStrata[blocks] = strata
+    means, blockStrata = means[sizes > 0], blockStrata[sizes > 0]
+    variance = 0.0
+    for stratum in np.unique(blockStrata):
+        inStratum = means[blockStrata == stratum]
+        n = len(inStratum)
+        if n > 1:
+            weight = n/len(means)
+            variance += weight**2*inStratum.var(ddof = 1)/n
+    return float(np.sqrt(variance))
+
+"""
+makes numShoes shoes in the given mode with an RNG built from seedSequence
+and plays every table on them. Returns the profit and the rounds of every
+table on every shoe, each of shape (len(tables), numShoes), and the stratum
+and block of every shoe.
+"""
+def playChunk(numShoes, seedSequence, tables, mode = "plain"):
+    rng = np.random.default_rng(seedSequence)
+    shoes, strata, blocks = makeShoes(numShoes, rng, mode)
+    profits, rounds = playShoes(tables, shoes)
+    return profits, rounds, strata, blocks
+
+"""
+plays every table on every shoe, one unit a round, and returns the profit
+and the rounds of each, of shape (len(tables), len(shoes)). A round that
+runs past the end of a shoe finishes with the cards of the next shoe in
+shoes (the first, for the last).
+"""
+def playShoes(tables, shoes):
+    profits = np.empty((len(tables), len(shoes)))
+    rounds = np.empty((len(tables), len(shoes)), dtype = np.int64)
+    for j, shoe in enumerate(shoes):
+        pair, countSums = kernel.pairShoes(shoe, shoes[(j + 1) % len(shoes)])
+        for i, table in enumerate(tables):
+            # a bankroll of BANKROLL bets exactly one unit a round while it
+            # stays within half of BANKROLL, and one shoe never moves it that far
+            money, lowest, rounds[i, j], cursor = kernel._playShoe(pair, countSums, 0, float(BANKROLL), float(BANKROLL), 0, SHOE_SIZE,
+                                                                   table.actions, table.surrender, table.insurance)
+            profits[i, j] = money - BANKROLL
+    return profits, rounds
+
+"""
+numShoes shoes in the given mode, with the stratum and the block of each
+(every shoe is its own block, except antithetic pairs, and there is one
+stratum unless stratified)
+"""
+def makeShoes(numShoes, rng, mode = "plain"):
+    strata = np.zeros(numShoes, dtype = np.int64)
+    blocks = np.arange(numShoes)
+    if mode == "plain":
+        shoes = rng.permuted(np.broadcast_to(SHOE_CARDS, (numShoes, SHOE_SIZE)), axis = 1)
+    elif mode == "antithetic":
+        shoes = np.empty((numShoes, SHOE_SIZE), dtype = np.int8)
+        numPairs = (numShoes + 1)//2
+        shuffled = rng.permuted(np.broadcast_to(SHOE_CARDS, (numPairs, SHOE_SIZE)), axis = 1)
+        shoes[0::2] = shuffled
+        shoes[1::2] = shuffled[:numShoes//2, ::-1]
+        blocks = blocks//2
+    else:
+        probabilities, compositions = cutStrata()
+        stratumList = sorted(probabilities)
+        p = np.array([probabilities[s] for s in stratumList])
+        # proportional allocation, the remainder going to the largest fractions
+        quotas = np.floor(numShoes*p).astype(int)
+        remainder = numShoes - quotas.sum()
+        quotas[np.argsort(quotas - numShoes*p)[:remainder]] += 1
+        strata = np.repeat(stratumList, quotas)
+        shoes = np.array([stratifiedShoe(rng, compositions[s]) for s in strata], dtype = np.int8).reshape(numShoes, SHOE_SIZE)
+    return shoes, strata, blocks
+
+"""
+a shoe whose cards behind the cut hold (low, neutral, high) cards as drawn
+from composition, a list of ((low, high), probability) pairs
+"""
+def stratifiedShoe(rng, composition):
+    pairs, p = zip(*composition)
+    low, high = pairs[rng.choice(len(pairs), p = np.array(p)/sum(p))]
+    neutral = RESHUFFLE_AT - low - high
+    cut = []
+    played = []
+    for kind, number in ((1, low), (0, neutral), (-1, high)):
+        group = rng.permutation(SHOE_CARDS[HILO[SHOE_CARDS] == kind])
+        cut.append(group[:number])
+        played.append(group[number:])
+    return np.concatenate([rng.permutation(np.concatenate(played)), rng.permutation(np.concatenate(cut))])
+
+"""
+The strata of the stratified mode, from the exact (multivariate
+hypergeometric) chances of the low and high cards behind the cut: the
+probability of every stratum, and for each the (low, high) compositions
+that make it up with their probabilities.
+"""
+@lru_cache(maxsize = None)
+def cutStrata():
+    counts = {kind: int(np.sum(HILO[SHOE_CARDS] == kind)) for kind in (1, 0, -1)}
+    total = comb(SHOE_SIZE, RESHUFFLE_AT)
+    probabilities = {}
+    compositions = {}
+    for low in range(RESHUFFLE_AT + 1):
+        for high in range(RESHUFFLE_AT + 1 - low):
+            ways = comb(counts[1], low)*comb(counts[-1], high)*comb(counts[0], RESHUFFLE_AT - low - high)
+            if ways == 0:
+                continue
+            p = ways/total
+            stratum = min(max(low - high, -MAX_STRATUM), MAX_STRATUM)
+            probabilities[stratum] = probabilities.get(stratum, 0.0) + p
+            compositions.setdefault(stratum, []).append(((low, high), p))
+    return probabilities, compositions
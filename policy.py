@@ -0,0 +1,322 @@
+"""
+Playing strategies as lookup tables.
+
+histo.autoPlay used to walk a long chain of conditionals for every decision.
+A StrategyTable instead stores the action for every situation up front,
+indexed by
+
+    (a) the kind of hand: HARD, SOFT or PAIR
+    (b) its total (for a PAIR, the rank of the paired card)
+    (c) the dealer's upCard
+    (d) whether the hand may still double (i.e. it has two cards)
+    (e) the true count, floored and clamped as in stats.tcIndex
+
+so a decision is a single lookup. Actions use the same codes and order as
+strategy.CHOICES. Surrender is a separate table with the same axes, since
+it is only offered on the initial hand, and insurance one more, by true
+count alone, since it only depends on the dealer's Ace.
+
+basicStrategy builds the table histo has always played, and fromStrategy
+builds one from the {key: (bestChoice, expectation)} dictionary returned
+by strategy.main or solver.main, so a simulation can play any generated
+strategy.
+
+Count-dependent play is written down as index plays: an IndexPlay says
+that a situation is played one way below a true count and another way from
+it up. findIndexPlays reads them off a strategy dictionary (every count at
+which its best action flips), withIndexPlays writes them into a table, and
+Basic Strategy's own deviations are BASIC_INDEX_PLAYS.
+"""
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+import cards
+from cards import ACE, TEN
+from rules import DEFAULT_RULES
+from stats import MIN_TC, MAX_TC, NUM_TCS
+
+HARD = 0
+SOFT = 1
+PAIR = 2
+NUM_KINDS = 3
+NUM_TOTALS = 22 # 0 through 21
+NUM_UPCARDS = 11 # indexed by card, index 0 is unused
+
+ACTIONS = ("stand", "hit", "double", "split")
+STAND = 0
+HIT = 1
+DOUBLE = 2
+SPLIT = 3
+
+
+"""
+the situation is (kind, index, upCard, canDouble) as a table is indexed,
+with canDouble None for both; below is played under trueCount and above from it up
+"""
+IndexPlay = namedtuple("IndexPlay", ("kind", "index", "upCard", "canDouble", "below", "above", "trueCount"))
+
+# split tens against a 4, 5 or 6 once upCard + true count reaches 10
+BASIC_INDEX_PLAYS = tuple(IndexPlay(PAIR, TEN, upCard, None, STAND, SPLIT, 10 - upCard) for upCard in (4, 5, 6))
+
+
+class StrategyTable:
+    def __init__(self, actions = None, surrender = None, insurance = None):
+        if actions is None:
+            actions = np.full((NUM_KINDS, NUM_TOTALS, NUM_UPCARDS, 2, NUM_TCS), STAND, dtype=np.int8)
+        if surrender is None:
+            surrender = np.zeros((NUM_KINDS, NUM_TOTALS, NUM_UPCARDS, NUM_TCS), dtype=bool)
+        if insurance is None:
+            insurance = np.zeros(NUM_TCS, dtype=bool)
+        self.actions = actions
+        self.surrender = surrender
+        self.insurance = insurance
+        self.compile()
+
+    """
+    The arrays are the table; nested lists of them are what we actually
+    look up in, since they index faster than numpy scalars in the play loop.
+    Call again after changing the arrays.
+    """
+    def compile(self):
+        self.actionRows = self.actions.tolist()
+        self.surrenderRows = self.surrender.tolist()
+        self.insuranceRows = self.insurance.tolist()
+
+    def copy(self):
+        return StrategyTable(self.actions.copy(), self.surrender.copy(), self.insurance.copy())
+
+    """
+    the action code for the hand with state and cardList against upCard,
+    at the true count with index tc (as stats.tcIndex, or histo.Shoe.getTcIndex).
+    canSplit and canDouble say whether the rules still allow a two card
+    hand to split or double; if not, it is played like a longer hand.
+    """
+    def action(self, state, cardList, upCard, tc, canSplit = True, canDouble = True):
+        if state[2] == 2:
+            if canSplit and cardList[0] == cardList[1]:
+                return self.actionRows[PAIR][cardList[0]][upCard][int(canDouble)][tc]
+            return self.actionRows[cards.SOFT[state[1] > 0][state[0]]][cards.total(state)][upCard][int(canDouble)][tc]
+        return self.actionRows[cards.SOFT[state[1] > 0][state[0]]][cards.total(state)][upCard][0][tc]
+
+    def surrenders(self, state, cardList, upCard, tc):
+        if state[2] != 2 or cards.isBlackjack(state):
+            return False
+        if cardList[0] == cardList[1]:
+            return self.surrenderRows[PAIR][cardList[0]][upCard][tc]
+        return self.surrenderRows[cards.SOFT[state[1] > 0][state[0]]][cards.total(state)][upCard][tc]
+
+    """
+    whether to insure against the dealer's Ace, at the true count with index tc
+    """
+    def insures(self, tc):
+        return self.insuranceRows[tc]
+
+    def save(self, path):
+        np.savez(path, actions = self.actions, surrender = self.surrender, insurance = self.insurance)
+
+def loadTable(path):
+    data = np.load(path)
+    # tables saved before insurance was added never insure
+    insurance = data["insurance"] if "insurance" in data.files else None
+    return StrategyTable(data["actions"], data["surrender"], insurance)
+
+"""
+Basic Strategy, as borrowed from blackjackapprenticeship.com.
+Doubles are only allowed on two cards: where the chart says double, a
+longer hand hits, except on soft 18 and soft 19 where it stands.
+The only deviations from it are BASIC_INDEX_PLAYS.
+There is one table per Rules; without surrender, nothing is surrendered.
+Insurance is never taken. Don't change the table you get back, copy it.
+"""
+@lru_cache(maxsize = None)
+def basicStrategy(rules = DEFAULT_RULES):
+    actions = np.zeros((NUM_KINDS, NUM_TOTALS, NUM_UPCARDS, 2, NUM_TCS), dtype=np.int8)
+    surrender = np.zeros((NUM_KINDS, NUM_TOTALS, NUM_UPCARDS, NUM_TCS), dtype=bool)
+    for upCard in cards.RANKS:
+        upValue = cards.cardValue(upCard)
+        for total in range(NUM_TOTALS):
+            actions[HARD, total, upCard, 1] = _hardAction(total, upCard, upValue)
+            actions[SOFT, total, upCard, 1] = _softAction(total, upCard, upValue)
+        for kind in (HARD, SOFT):
+            for total in range(NUM_TOTALS):
+                noDouble = STAND if kind == SOFT and total in (18, 19) else HIT
+                withDouble = actions[kind, total, upCard, 1]
+                actions[kind, total, upCard, 0] = np.where(withDouble == DOUBLE, noDouble, withDouble)
+
+        # a pair that isn't split is played on its total
+        for card in cards.RANKS:
+            if card == ACE:
+                actions[PAIR, card, upCard] = actions[SOFT, 12, upCard]
+            else:
+                actions[PAIR, card, upCard] = actions[HARD, 2*card, upCard]
+            if _splits(card, upCard, upValue):
+                actions[PAIR, card, upCard] = SPLIT
+
+    if rules.surrender != "none":
+        surrender[HARD, 16, [9, TEN, ACE]] = True
+        surrender[HARD, 15, TEN] = True
+        surrender[PAIR, 8, [9, TEN, ACE]] = True
+    return withIndexPlays(StrategyTable(actions, surrender), BASIC_INDEX_PLAYS)
+
+def _splits(card, upCard, upValue):
+    if card in (ACE, 8):
+        return True
+    if card == 9:
+        return upCard in (2, 3, 4, 5, 6, 8, 9)
+    if card in (6, 7):
+        return upValue <= card
+    if card == 4:
+        return upCard in (4, 5)
+    if card in (2, 3):
+        return upValue < 8
+    return False
+
+def _hardAction(total, upCard, upValue):
+    if total > 16:
+        return STAND
+    if total > 12:
+        return HIT if upValue > 6 else STAND
+    if total == 12:
+        return STAND if upCard in (4, 5, 6) else HIT
+    if total == 11:
+        return DOUBLE
+    if total == 10:
+        return HIT if upValue > 9 else DOUBLE
+    if total == 9:
+        return DOUBLE if upCard in (3, 4, 5, 6) else HIT
+    return HIT
+
+def _softAction(total, upCard, upValue):
+    if total > 19:
+        return STAND
+    if total == 19:
+        return DOUBLE if upCard == 6 else STAND
+    if total == 18:
+        if upValue > 8:
+            return HIT
+        return STAND if upCard > 6 else DOUBLE
+    if total == 17:
+        return DOUBLE if upCard in (3, 4, 5, 6) else HIT
+    if total in (15, 16):
+        return DOUBLE if upCard in (4, 5, 6) else HIT
+    if total in (13, 14):
+        return DOUBLE if upCard in (5, 6) else HIT
+    return HIT
+
+"""
+Builds a table from a strategy dictionary as returned by strategy.main or
+solver.main, keyed (value, canSplit, isSoft, canDouble, canHit, upCard, count).
+Each table count uses the closest count the dictionary has, and situations
+the dictionary doesn't cover keep their action from base (Basic Strategy by default).
+surrender is a {key: (surrenders, expectation)} dictionary as returned by
+strategy.surrenderTable or solver.main, and the two card hands the strategy
+covers surrender exactly where it says so (without one, nowhere).
+insurance is a {count: (insure, expectation)} dictionary as returned by
+strategy.insuranceTable, and sets when to insure the same way.
+Pairs only come with a double, so a pair that may not double (after a split
+without rules.doubleAfterSplit) is played the same way, except that where
+the strategy doubles it is played as its total without a double.
+"""
+def fromStrategy(strategy, base = None, insurance = None, surrender = None):
+    table = (base or basicStrategy()).copy()
+    if insurance:
+        insuranceCounts = sorted(insurance)
+        for tc in range(MIN_TC, MAX_TC + 1):
+            table.insurance[tc - MIN_TC] = insurance[_closest(insuranceCounts, tc)][0]
+    counts = sorted(set(key[6] for key in strategy if key[6] is not None))
+    if not counts:
+        table.compile()
+        return table
+    pairs = []
+    for key, (choice, expectation) in strategy.items():
+        situation = _situation(key)
+        if situation is None:
+            continue
+        kind, index, upCard, canDouble = situation
+        count = key[6]
+        tcs = [tc - MIN_TC for tc in range(MIN_TC, MAX_TC + 1) if _closest(counts, tc) == count]
+        if canDouble:
+            table.surrender[kind, index, upCard, tcs] = surrender is not None and surrender.get(key, (False,))[0]
+        table.actions[kind, index, upCard, int(canDouble), tcs] = ACTIONS.index(choice)
+        if kind == PAIR:
+            pairs.append((key, index, upCard, tcs, choice))
+    for key, index, upCard, tcs, choice in pairs:
+        if choice == "double":
+            table.actions[PAIR, index, upCard, 0, tcs] = table.actions[SOFT if key[2] else HARD, key[0], upCard, 0, tcs]
+        else:
+            table.actions[PAIR, index, upCard, 0, tcs] = ACTIONS.index(choice)
+    table.compile()
+    return table
+
+def _closest(counts, tc):
+    return min(counts, key = lambda count: (abs(count - tc), count))
+
+"""
+where a strategy key sits in a table, as (kind, index, upCard, canDouble),
+or None if it isn't a decision a table holds
+"""
+def _situation(key):
+    value, canSplit, isSoft, canDouble, canHit, upCard, count = key
+    if upCard is None or count is None or not canHit or value in (cards.BUST, cards.NATURAL):
+        return None
+    if canSplit:
+        return (PAIR, (ACE if isSoft else value//2), upCard, int(canDouble))
+    return ((SOFT if isSoft else HARD), value, upCard, int(canDouble))
+
+"""
+The index plays of a strategy dictionary (as for fromStrategy): for every
+situation, each count at which the best action changes from the one at the
+count below it. A table count goes with its closest count in the
+dictionary, as in fromStrategy, so between two counts the play flips at the
+first table count nearer the higher one. Situations played the same way
+at every count have no index play (fromStrategy has them), so
+withIndexPlays(fromStrategy(strategy), plays) is fromStrategy(strategy)
+when the dictionary covers every count.
+"""
+def findIndexPlays(strategy):
+    choices = {}
+    for key, (choice, expectation) in strategy.items():
+        situation = _situation(key)
+        if situation is not None:
+            choices.setdefault(situation, []).append((int(key[6]), ACTIONS.index(choice)))
+    plays = []
+    for situation in sorted(choices):
+        byCount = sorted(choices[situation])
+        for (lower, below), (upper, above) in zip(byCount, byCount[1:]):
+            if below != above:
+                plays.append(IndexPlay(*situation, below, above, (lower + upper)//2 + 1))
+    return plays
+
+"""
+a copy of table with every play written into it. The plays of one
+situation are taken in order of trueCount, each one deciding every count
+from its own up, and the first also every count below it.
+"""
+def withIndexPlays(table, plays):
+    table = table.copy()
+    done = set()
+    for play in sorted(plays, key = lambda play: play.trueCount):
+        doubles = [0, 1] if play.canDouble is None else [play.canDouble]
+        tc = min(max(play.trueCount, MIN_TC), MAX_TC + 1) - MIN_TC
+        situation = play[:4]
+        if situation not in done:
+            table.actions[play.kind, play.index, play.upCard, doubles, :tc] = play.below
+            done.add(situation)
+        table.actions[play.kind, play.index, play.upCard, doubles, tc:] = play.above
+    table.compile()
+    return table
+
+"""
+an index play the way a card counter writes it, e.g. "10,10 v 5: split from +5 (stand below)"
+"""
+def describe(play):
+    names = {ACE: "A", TEN: "T"}
+    upCard = names.get(play.upCard, str(play.upCard))
+    if play.kind == PAIR:
+        card = names.get(play.index, str(play.index))
+        hand = card + "," + card
+    else:
+        hand = ("soft " if play.kind == SOFT else "") + str(play.index)
+    if play.canDouble == 0:
+        hand += " (3+ cards)"
+    return "%s v %s: %s from %+d (%s below)" % (hand, upCard, ACTIONS[play.above], play.trueCount, ACTIONS[play.below])
@@ -0,0 +1,68 @@
+"""
+The rules of the game, in one place.
+
+A Rules object says how many decks are in the shoe and how the dealer, the
+splits, surrender, blackjacks and reshuffling work. It is frozen, so it
+hashes by value: anything derived from the rules alone (Basic Strategy
+tables, solved strategies, bucket stores) is cached per Rules, and sweeping
+many variants only recomputes what actually differs.
+
+DEFAULT_RULES is the game histo.py and strategy.py have always played:
+six decks, dealer stands on soft 17, double after split, unlimited resplits
+(Aces too), late surrender, 3:2 blackjacks, a reshuffle once fewer than 26
+cards are left, and 1000 rounds to a game.
+"""
+from dataclasses import dataclass
+from cards import ACE
+
+SURRENDER_TYPES = ("none", "late")
+# the cards every round takes before anyone plays: two to the player and two
+# to the dealer. A round that needs more than the cut leaves goes on into the
+# next shoe, so the cut only has to cover the deal.
+DEAL_CARDS = 4
+# how many hands the strategy generators follow resplits to when maxHands is 0
+MAX_SPLIT_HANDS = 8
+
+
+@dataclass(frozen = True)
+class Rules:
+    decks: int = 6
+    hitSoft17: bool = False
+    doubleAfterSplit: bool = True
+    # the most hands one round can be split into, 0 for no limit
+    maxHands: int = 0
+    resplitAces: bool = True
+    surrender: str = "late"
+    blackjackPayout: float = 1.5
+    reshuffleAt: int = 26
+    roundsPerGame: int = 1000
+
+    def __post_init__(self):
+        if self.surrender not in SURRENDER_TYPES:
+            raise ValueError("surrender must be one of " + str(SURRENDER_TYPES) + ", not " + repr(self.surrender))
+        if self.decks < 1:
+            raise ValueError("a shoe needs at least one deck")
+        if self.maxHands < 0:
+            raise ValueError("maxHands must be 0 (no limit) or more, not " + repr(self.maxHands))
+        if self.blackjackPayout <= 0:
+            raise ValueError("blackjackPayout must be positive, not " + repr(self.blackjackPayout))
+        if not DEAL_CARDS <= self.reshuffleAt <= self.shoeSize():
+            raise ValueError("reshuffleAt must be between " + str(DEAL_CARDS) + " and the " + str(self.shoeSize())
+                             + " cards of the shoe, not " + repr(self.reshuffleAt))
+        if self.roundsPerGame < 1:
+            raise ValueError("a game needs at least one round")
+
+    def shoeSize(self):
+        return 52*self.decks
+
+    """
+    whether a hand that is already one of numHands hands may split its pair of pairCard
+    """
+    def canSplit(self, pairCard, numHands):
+        if self.maxHands and numHands >= self.maxHands:
+            return False
+        if pairCard == ACE and numHands > 1 and not self.resplitAces:
+            return False
+        return True
+
+DEFAULT_RULES = Rules()
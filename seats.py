@@ -0,0 +1,265 @@
+"""
+A table of several seats sharing one shoe.
+
+histo.newGame seats a single player against the dealer. At a real table up
+to seven seats draw from the same shoe, so each round uses more cards, the
+count moves further between rounds, and the shoe is reshuffled sooner.
+Here every seat has its own
+
+    (a) strategy (a policy.StrategyTable)
+    (b) bet spread (a betting.BetSpread), sized at the true count at the
+        start of the round
+    (c) bankroll, together with the lowest it has been
+
+all held in arrays indexed by seat. Each round the seats are dealt their two
+cards in turn, then the dealer's upCard and hole card, and the seats play
+out their hands in order before the dealer draws once for everyone. A seat
+whose bankroll drops below zero leaves the table; the game ends when the
+rounds run out or every seat has left. The more seats, the more cards a
+round takes, so the default cut grows with them (see reshuffleCut).
+
+The round loop follows kernel.py (and is compiled with numba the same way
+when it is available), so it also plays rules.DEFAULT_RULES, apart from
+reshuffleAt. A single seat with histo.FLAT_SPREAD and reshuffleAt = 26
+plays exactly newGame.
+"""
+import numpy as np
+from cards import ACE
+from histo import BANKROLL, SHOE_CARDS, BASIC_STRATEGY, FLAT_SPREAD
+from rules import DEFAULT_RULES, DEAL_CARDS
+from kernel import njit, pairShoes, _deal, _tcIndex, MAX_HANDS, NATURAL, BUST
+import policy
+
+MAX_SEATS = 7
+ROUNDS_PER_GAME = DEFAULT_RULES.roundsPerGame
+RESHUFFLE_AT = DEFAULT_RULES.reshuffleAt
+
+
+"""
+the default cut for numSeats seats: rules.DEFAULT_RULES's cut for the two
+hands of a lone seat and the dealer, scaled by the hands at the table
+"""
+def reshuffleCut(numSeats):
+    return RESHUFFLE_AT*(numSeats + 1)//2
+
+"""
+plays one game at a table of numSeats seats, dealing shoes from rng, and
+returns each seat's final bankroll and the lowest bankroll it reached.
+tables and spreads hold one StrategyTable and one betting.BetSpread per seat
+(Basic Strategy and histo.FLAT_SPREAD by default). The shoe is reshuffled
+before a round once fewer than reshuffleAt cards are left in it
+(reshuffleCut(numSeats) by default), and a round that runs out of cards
+goes on with the next shoe.
+"""
+def playTable(rng, numSeats = MAX_SEATS, tables = None, spreads = None, numRounds = ROUNDS_PER_GAME, reshuffleAt = None):
+    if reshuffleAt is None:
+        reshuffleAt = reshuffleCut(numSeats)
+    if not DEAL_CARDS + 2*(numSeats - 1) <= reshuffleAt <= len(SHOE_CARDS):
+        raise ValueError("reshuffleAt must leave the " + str(DEAL_CARDS + 2*(numSeats - 1)) + " cards of the deal for "
+                         + str(numSeats) + " seats, and at most the " + str(len(SHOE_CARDS)) + " of the shoe, not " + repr(reshuffleAt))
+    if tables is None:
+        tables = [BASIC_STRATEGY]*numSeats
+    if spreads is None:
+        spreads = [FLAT_SPREAD]*numSeats
+    actions = np.stack([table.actions for table in tables])
+    surrender = np.stack([table.surrender for table in tables])
+    insurance = np.stack([table.insurance for table in tables])
+    units = np.stack([spread.units for spread in spreads])
+    fractions = np.stack([spread.fractions for spread in spreads])
+    limits = np.array([(spread.tableMin, spread.tableMax) for spread in spreads], dtype=float)
+    money = np.full(numSeats, float(BANKROLL))
+    lowest = money.copy()
+    rounds = 0
+    cursor = 0
+    # shoes are dealt in pairs, as kernel.playGame
+    shoe = rng.permutation(SHOE_CARDS)
+    while True:
+        spare = rng.permutation(SHOE_CARDS)
+        shoes, countSums = pairShoes(shoe, spare)
+        rounds, cursor = _playShoe(shoes, countSums, cursor, money, lowest, rounds, numRounds, actions, surrender, insurance,
+                                   units, fractions, limits, reshuffleAt)
+        if rounds >= numRounds or not (money >= 0).any():
+            return money, lowest
+        cursor = cursor - len(shoe) if cursor > len(shoe) else 0
+        shoe = spare
+
+"""
+plays numGames independent tables with an RNG built from seed, and returns
+the floored profit and the lowest bankroll of every seat, each of shape (numGames, numSeats)
+"""
+def playTables(numGames, numSeats = MAX_SEATS, seed = None, tables = None, spreads = None,
+               numRounds = ROUNDS_PER_GAME, reshuffleAt = None):
+    rng = np.random.default_rng(seed)
+    profits = np.empty((numGames, numSeats))
+    lowests = np.empty((numGames, numSeats))
+    for i in range(numGames):
+        money, lowest = playTable(rng, numSeats, tables, spreads, numRounds, reshuffleAt)
+        profits[i] = np.floor(money - BANKROLL)
+        lowests[i] = lowest
+    return profits, lowests
+
+"""
+plays rounds from the first of a pair of shoes (see kernel.pairShoes) from
+cursor on until it is down to its last reshuffleAt cards, a round has gone
+on into the second, or the game is over. money and lowest are updated in
+place; returns the number of rounds played so far and the cursor.
+Each seat bets as betting.BetSpread.bet, from its row of units and
+fractions and its (tableMin, tableMax) in limits.
+"""
+@njit(cache = True)
+def _playShoe(shoe, countSums, cursor, money, lowest, rounds, numRounds, actions, surrender, insurance,
+              units, fractions, limits, reshuffleAt):
+    size = len(shoe)//2
+    numSeats = len(money)
+    hard = np.zeros((numSeats, MAX_HANDS), dtype=np.int64)
+    hasAce = np.zeros((numSeats, MAX_HANDS), dtype=np.bool_)
+    numCards = np.zeros((numSeats, MAX_HANDS), dtype=np.int64)
+    firstCard = np.zeros((numSeats, MAX_HANDS), dtype=np.int64)
+    secondCard = np.zeros((numSeats, MAX_HANDS), dtype=np.int64)
+    bets = np.zeros((numSeats, MAX_HANDS))
+    frozen = np.zeros((numSeats, MAX_HANDS), dtype=np.bool_)
+    numSlots = np.zeros(numSeats, dtype=np.int64)
+    stack = np.zeros(MAX_HANDS, dtype=np.int64)
+    seated = np.zeros(numSeats, dtype=np.bool_)
+    while rounds < numRounds and size - cursor >= reshuffleAt:
+        seated[:] = money >= 0
+        if not seated.any():
+            break
+        # bets at the count before the deal, then every seat's two cards
+        tc = _tcIndex(countSums, cursor, size)
+        frozen[:, :] = False
+        numSlots[:] = 0
+        for seat in range(numSeats):
+            if not seated[seat]:
+                continue
+            bet = units[seat, tc] + fractions[seat, tc]*money[seat]
+            bet = float(round(min(max(bet, limits[seat, 0]), limits[seat, 1])))
+            money[seat] -= bet
+            card1, cursor = _deal(shoe, cursor)
+            card2, cursor = _deal(shoe, cursor)
+            hard[seat, 0] = card1 + card2
+            hasAce[seat, 0] = card1 == ACE or card2 == ACE
+            numCards[seat, 0] = 2
+            firstCard[seat, 0] = card1
+            secondCard[seat, 0] = card2
+            bets[seat, 0] = bet
+            numSlots[seat] = 1
+        upCard, cursor = _deal(shoe, cursor)
+        holeCard, cursor = _deal(shoe, cursor)
+
+        # the dealer only checks for blackjack under an Ace, after the seats
+        # decide on insurance at the count without the hole card
+        roundOver = upCard == ACE and holeCard == 10
+        for seat in range(numSeats):
+            if not seated[seat]:
+                continue
+            if upCard == ACE and insurance[seat, _tcIndex(countSums, cursor - 1, size)]:
+                insured = bets[seat, 0]/2
+                money[seat] -= insured
+                if roundOver:
+                    money[seat] += 3*insured
+            if roundOver:
+                frozen[seat, 0] = True
+                continue
+            # surrender, for the initial hand only
+            if not (hasAce[seat, 0] and hard[seat, 0] == 11):
+                soft = hasAce[seat, 0] and hard[seat, 0] <= 11
+                tc = _tcIndex(countSums, cursor, size)
+                if firstCard[seat, 0] == secondCard[seat, 0]:
+                    surrenders = surrender[seat, policy.PAIR, firstCard[seat, 0], upCard, tc]
+                elif soft:
+                    surrenders = surrender[seat, policy.SOFT, hard[seat, 0] + 10, upCard, tc]
+                else:
+                    surrenders = surrender[seat, policy.HARD, hard[seat, 0], upCard, tc]
+                if surrenders:
+                    money[seat] += bets[seat, 0]/2
+                    continue
+
+            stack[0] = 0
+            stackSize = 1
+            while stackSize > 0:
+                top = stack[stackSize - 1]
+                if hard[seat, top] > 21:
+                    frozen[seat, top] = True
+                    stackSize -= 1
+                    continue
+                soft = hasAce[seat, top] and hard[seat, top] <= 11
+                total = hard[seat, top] + 10 if soft else hard[seat, top]
+                canDouble = 1 if numCards[seat, top] == 2 else 0
+                tc = _tcIndex(countSums, cursor, size)
+                if canDouble == 1 and firstCard[seat, top] == secondCard[seat, top]:
+                    action = actions[seat, policy.PAIR, firstCard[seat, top], upCard, 1, tc]
+                    if action == policy.SPLIT and numSlots[seat] == MAX_HANDS:
+                        action = actions[seat, 1 if soft else 0, total, upCard, 1, tc]
+                else:
+                    action = actions[seat, 1 if soft else 0, total, upCard, canDouble, tc]
+
+                if action == policy.STAND:
+                    frozen[seat, top] = True
+                    stackSize -= 1
+                elif action == policy.HIT or action == policy.DOUBLE:
+                    newCard, cursor = _deal(shoe, cursor)
+                    hard[seat, top] += newCard
+                    hasAce[seat, top] = hasAce[seat, top] or newCard == ACE
+                    numCards[seat, top] += 1
+                    if action == policy.DOUBLE:
+                        money[seat] -= bets[seat, top]
+                        bets[seat, top] *= 2
+                        frozen[seat, top] = True
+                        stackSize -= 1
+                else:
+                    pairCard = firstCard[seat, top]
+                    new = numSlots[seat]
+                    numSlots[seat] += 1
+                    bets[seat, new] = bets[seat, top]
+                    money[seat] -= bets[seat, top]
+                    for slot in (top, new):
+                        newCard, cursor = _deal(shoe, cursor)
+                        hard[seat, slot] = pairCard + newCard
+                        hasAce[seat, slot] = pairCard == ACE or newCard == ACE
+                        numCards[seat, slot] = 2
+                        firstCard[seat, slot] = pairCard
+                        secondCard[seat, slot] = newCard
+                        frozen[seat, slot] = False
+                    stack[stackSize] = new
+                    stackSize += 1
+
+        # the dealer draws once for the whole table, standing on soft 17
+        dHard = upCard + holeCard
+        dAce = upCard == ACE or holeCard == ACE
+        dNumCards = 2
+        if not roundOver:
+            while (dHard + 10 if dAce and dHard <= 11 else dHard) < 17:
+                newCard, cursor = _deal(shoe, cursor)
+                dHard += newCard
+                dAce = dAce or newCard == ACE
+                dNumCards += 1
+        if dNumCards == 2 and dAce and dHard == 11:
+            dScore = NATURAL
+        elif dHard > 21:
+            dScore = BUST
+        else:
+            dScore = float(dHard + 10 if dAce and dHard <= 11 else dHard)
+
+        # after a split, a two card 21 is a plain 21
+        for seat in range(numSeats):
+            for slot in range(numSlots[seat]):
+                if not frozen[seat, slot]:
+                    continue
+                if numSlots[seat] == 1 and numCards[seat, slot] == 2 and hasAce[seat, slot] and hard[seat, slot] == 11:
+                    if dScore != NATURAL:
+                        money[seat] += 2.5*bets[seat, slot]
+                    else:
+                        money[seat] += bets[seat, slot]
+                    continue
+                if hard[seat, slot] > 21:
+                    continue
+                pScore = float(hard[seat, slot] + 10 if hasAce[seat, slot] and hard[seat, slot] <= 11 else hard[seat, slot])
+                if pScore > dScore:
+                    money[seat] += 2*bets[seat, slot]
+                elif pScore == dScore:
+                    money[seat] += bets[seat, slot]
+            if seated[seat] and money[seat] < lowest[seat]:
+                lowest[seat] = money[seat]
+        rounds += 1
+    return rounds, cursor
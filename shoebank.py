@@ -0,0 +1,100 @@
+"""
+A bank of shoes shuffled once and kept on disk.
+
+Every game of histo.newGame and every shoe of strategy.makeBuckets shuffles
+a fresh shoe, and the shuffling shows up in the profile. makeBank shuffles
+numShoes shoes up front, in blocks of SHOES_PER_BLOCK with numpy, into an
+int8 .npy file (one shoe per row, the cards coded as in cards.py), with the
+seed and the number of decks in a JSON file next to it. The same seed
+always makes the same bank.
+
+openBank maps the file read-only, so any number of processes read the same
+pages without copying them, and a ShoeBank pickles as its path alone.
+ShoeBank.stream(start) gives a ShoeStream, which stands in for the random
+number generator of the simulator and the bucket builder: its permutation
+(as histo.newShoe calls it) and shuffle (as makeBuckets calls it) hand out
+the bank's shoes in order from start, starting over from the first shoe
+once the bank runs out. So
+
+    histo.histogram(numIters, bank = bank)
+    strategy.makeStats(numShoes, bank = bank)
+
+play and sample the bank's shoes instead of shuffling, and give the same
+results on any number of workers.
+"""
+import json
+import numpy as np
+import cards
+
+BANK_VERSION = 1
+SHOES_PER_BLOCK = 10000
+
+
+"""
+shuffles numShoes shoes of the given number of decks into path (and its
+JSON sidecar path + ".json"), and returns the opened ShoeBank
+"""
+def makeBank(path, numShoes, seed = None, decks = 6):
+    shoeCards = np.array(decks*cards.DECK, dtype = np.int8)
+    seedSequence = np.random.SeedSequence(seed)
+    shoes = np.lib.format.open_memmap(path, mode = "w+", dtype = np.int8, shape = (numShoes, len(shoeCards)))
+    numBlocks = -(-numShoes // SHOES_PER_BLOCK)
+    for i, blockSeed in enumerate(seedSequence.spawn(numBlocks)):
+        first = i*SHOES_PER_BLOCK
+        last = min(first + SHOES_PER_BLOCK, numShoes)
+        rng = np.random.default_rng(blockSeed)
+        shoes[first:last] = rng.permuted(np.broadcast_to(shoeCards, (last - first, len(shoeCards))), axis = 1)
+    shoes.flush()
+    del shoes
+    with open(path + ".json", "w") as f:
+        json.dump({"version": BANK_VERSION, "numShoes": numShoes, "decks": decks, "entropy": seedSequence.entropy}, f)
+    return openBank(path)
+
+def openBank(path):
+    return ShoeBank(path)
+
+class ShoeBank:
+    def __init__(self, path):
+        with open(path + ".json") as f:
+            header = json.load(f)
+        if header["version"] != BANK_VERSION:
+            raise ValueError("shoe bank " + path + " has version " + str(header["version"]) + ", not " + str(BANK_VERSION))
+        self.path = path
+        self.decks = header["decks"]
+        self.entropy = header["entropy"]
+        self.shoes = np.load(path, mmap_mode = "r")
+        if len(self.shoes) != header["numShoes"]:
+            raise ValueError("shoe bank " + path + " holds " + str(len(self.shoes)) + " shoes, not " + str(header["numShoes"]))
+
+    def __len__(self):
+        return len(self.shoes)
+
+    # only the path crosses between processes; each one maps the file itself
+    def __reduce__(self):
+        return (openBank, (self.path,))
+
+    def stream(self, start = 0):
+        return ShoeStream(self, start)
+
+"""
+Hands out a bank's shoes in order, in place of an RNG. Every call to
+permutation or shuffle takes the next shoe, whatever cards it was given,
+as long as there are as many of them as a shoe of the bank holds.
+"""
+class ShoeStream:
+    def __init__(self, bank, start = 0):
+        self.bank = bank
+        self.position = start % len(bank)
+
+    def next(self, numCards):
+        if numCards != self.bank.shoes.shape[1]:
+            raise ValueError("the bank's shoes have " + str(self.bank.shoes.shape[1]) + " cards, not " + str(numCards))
+        shoe = self.bank.shoes[self.position]
+        self.position = (self.position + 1) % len(self.bank)
+        return shoe
+
+    def permutation(self, cardArray):
+        return self.next(len(cardArray))
+
+    def shuffle(self, cardList):
+        cardList[:] = self.next(len(cardList)).tolist()
@@ -0,0 +1,286 @@
+"""
+Exact, composition-dependent expectations for every playing decision.
+
+strategy.makeExpectations learns the value of each decision from sampled
+buckets, which needs an enormous number of shoes before the rare buckets
+are covered. Here we compute the expected profit of standing, hitting,
+doubling, splitting and surrendering directly from a deck composition
+(see dealer.py for the format):
+
+    (a) standing asks dealer.py for the dealer's chances against the shoe
+        as it was once the player's first two cards and the upCard were out
+    (b) hitting and doubling average over every card the player could draw,
+        taking that card out of the composition the player draws from
+    (c) each split hand starts from the pair card plus one more card, may
+        double afterwards if the rules let it, and may be split again as
+        far as they allow (see splitEV)
+    (d) surrendering always returns half the bet, so it is worth -0.5
+    (e) as in histo.checkInsurance, the dealer checks for blackjack under
+        an Ace before anyone plays, so against an Ace the dealer's hand is
+        drawn without one and every choice, surrender too, loses just the
+        one bet to a blackjack (see peekedExpectation)
+
+Everything is memoized on (hand state, upCard, composition), so hands that
+reach the same total with the same cards out share their work. Keeping the
+dealer's composition fixed for the whole hand (rather than removing every
+card the player draws) means only a few hundred dealer distributions are
+ever needed, which is what keeps a full table down to seconds.
+solveStrategy emits the same {key: (bestChoice, expectation)} dictionary
+that strategy.main returns, the best way to play on, and can fill in a
+{key: (surrenders, expectation)} dictionary like strategy.surrenderTable.
+"""
+from functools import lru_cache
+import cards
+import dealer
+from cards import ACE
+from rules import DEFAULT_RULES, MAX_SPLIT_HANDS, Rules
+
+SURRENDER_EV = -0.5
+CHOICES = ("stand", "hit", "double", "split")
+
+
+"""
+the value of a hand that has stopped taking cards
+(a two card 21 after splitting is just 21, not a blackjack)
+"""
+def finalValue(hard, hasAce):
+    if hard > 21:
+        return cards.BUST
+    return cards.VALUES[hasAce][hard]
+
+"""
+Against an Ace we know the dealer has no blackjack by the time we stand,
+so the blackjacks are taken back out of the dealer's chances.
+"""
+@lru_cache(maxsize = 1 << 20)
+def standEV(hard, hasAce, upCard, dealerComposition, hitSoft17 = False):
+    ev = dealer.standExpectation(finalValue(hard, hasAce), upCard, dealerComposition, hitSoft17)
+    if upCard == ACE:
+        blackjack = dealer.dealerProbabilities(upCard, dealerComposition, hitSoft17)[dealer.BLACKJACK_INDEX]
+        if blackjack < 1:
+            ev = (ev + blackjack)/(1 - blackjack)
+    return ev
+
+"""
+takes one card and then plays on as well as possible
+"""
+@lru_cache(maxsize = 1 << 20)
+def hitEV(hard, hasAce, upCard, composition, dealerComposition, hitSoft17 = False):
+    remaining = sum(composition)
+    ev = 0.0
+    for i in range(10):
+        count = composition[i]
+        if count == 0:
+            continue
+        newHard = hard + i + 1
+        if newHard > 21:
+            ev -= count/remaining
+            continue
+        newAce = int(hasAce or i == 0)
+        newComposition = _without(composition, i)
+        ev += count/remaining*bestEV(newHard, newAce, upCard, newComposition, dealerComposition, hitSoft17)
+    return ev
+
+@lru_cache(maxsize = 1 << 20)
+def bestEV(hard, hasAce, upCard, composition, dealerComposition, hitSoft17 = False):
+    stEV = standEV(hard, hasAce, upCard, dealerComposition, hitSoft17)
+    if hard >= 21:
+        return stEV
+    return max(stEV, hitEV(hard, hasAce, upCard, composition, dealerComposition, hitSoft17))
+
+"""
+takes exactly one more card for twice the bet
+"""
+@lru_cache(maxsize = 1 << 20)
+def doubleEV(hard, hasAce, upCard, composition, dealerComposition, hitSoft17 = False):
+    remaining = sum(composition)
+    ev = 0.0
+    for i in range(10):
+        count = composition[i]
+        if count == 0:
+            continue
+        newHard = hard + i + 1
+        if newHard > 21:
+            ev -= count/remaining
+            continue
+        newAce = int(hasAce or i == 0)
+        ev += count/remaining*standEV(newHard, newAce, upCard, dealerComposition, hitSoft17)
+    return 2*ev
+
+"""
+splits a pair of pairCard. composition should already be missing both of
+the pair's cards. Each hand gets one more card, and split Aces must stand.
+The split rules (doubleAfterSplit, maxHands, resplitAces) come from splitRules.
+Both hands, and any hands split from them, are played against the same
+composition.
+"""
+def splitEV(pairCard, upCard, composition, hitSoft17 = False, splitRules = DEFAULT_RULES):
+    return 2*splitHandEV(pairCard, upCard, composition, 2, hitSoft17, splitRules)
+
+"""
+the worth of one split hand of pairCard in a round of numHands hands, as
+strategy.splitExpectations works it out: when the hand is the pair again,
+the better of playing it on and splitting it into two hands of a round of
+numHands + 1, if splitRules.canSplit allows (MAX_SPLIT_HANDS when there is no limit)
+"""
+@lru_cache(maxsize = 1 << 16)
+def splitHandEV(pairCard, upCard, composition, numHands, hitSoft17 = False, splitRules = DEFAULT_RULES):
+    mostHands = splitRules.maxHands if splitRules.maxHands else MAX_SPLIT_HANDS
+    remaining = sum(composition)
+    ev = 0.0
+    for i in range(10):
+        count = composition[i]
+        if count == 0:
+            continue
+        hard = pairCard + i + 1
+        hasAce = int(pairCard == ACE or i == 0)
+        newComposition = _without(composition, i)
+        if pairCard == ACE:
+            handEV = standEV(hard, hasAce, upCard, composition, hitSoft17)
+        else:
+            handEV = bestEV(hard, hasAce, upCard, newComposition, composition, hitSoft17)
+            if splitRules.doubleAfterSplit:
+                handEV = max(handEV, doubleEV(hard, hasAce, upCard, newComposition, composition, hitSoft17))
+        if i + 1 == pairCard and numHands < mostHands and splitRules.canSplit(pairCard, numHands):
+            handEV = max(handEV, 2*splitHandEV(pairCard, upCard, composition, numHands + 1, hitSoft17, splitRules))
+        ev += count/remaining*handEV
+    return ev
+
+"""
+the expectation of every legal choice for the two card hand (card1, card2),
+dealt from composition (which should already be missing the upCard),
+as a dictionary keyed by choice name
+"""
+def initialExpectations(card1, card2, upCard, composition, hitSoft17 = False, splitRules = DEFAULT_RULES):
+    composition = dealer.removeCards(composition, [card1, card2])
+    state = cards.handState([card1, card2])
+    hard, hasAce = state[0], int(state[1] > 0)
+    expectations = {
+        "stand": standEV(hard, hasAce, upCard, composition, hitSoft17),
+        "hit": hitEV(hard, hasAce, upCard, composition, composition, hitSoft17),
+        "double": doubleEV(hard, hasAce, upCard, composition, composition, hitSoft17),
+        "surrender": SURRENDER_EV,
+    }
+    if card1 == card2:
+        expectations["split"] = splitEV(card1, upCard, composition, hitSoft17, splitRules)
+    if upCard == ACE:
+        blackjack = dealer.dealerProbabilities(upCard, composition, hitSoft17)[dealer.BLACKJACK_INDEX]
+        expectations = {choice: peekedExpectation(ev, blackjack) for choice, ev in expectations.items()}
+    return expectations
+
+"""
+the expectation of a choice before the dealer checks under an Ace, from
+its expectation once there is no blackjack: it loses the one bet to a
+blackjack whatever it is
+"""
+def peekedExpectation(ev, blackjack):
+    return -blackjack + (1 - blackjack)*ev
+
+"""
+Builds a strategy dictionary with the same keys and (bestChoice, expectation)
+values as strategy.main, for one composition. count is the true count the
+composition stands for, and is only used to label the keys. Given a
+surrender dictionary, the two card hands' surrender decisions go into it.
+Splits follow the split rules of splitRules (see splitEV).
+"""
+def solveStrategy(composition, count = 0, hitSoft17 = False, surrender = None, splitRules = DEFAULT_RULES):
+    strategy = {}
+    for upCard in cards.RANKS:
+        upComposition = dealer.removeCards(composition, [upCard])
+        total = sum(upComposition)
+
+        # two card hands: every combination that lands in the same key is
+        # weighted by how likely it is to be dealt
+        sums = {}
+        weights = {}
+        for card1 in cards.RANKS:
+            for card2 in cards.RANKS:
+                if card2 < card1:
+                    continue
+                state = cards.handState([card1, card2])
+                if cards.isBlackjack(state):
+                    continue
+                n1 = upComposition[card1 - 1]
+                n2 = upComposition[card2 - 1] - (card1 == card2)
+                if n1 <= 0 or n2 <= 0:
+                    continue
+                weight = n1*n2/(total*(total - 1))
+                if card1 != card2:
+                    weight *= 2
+                key = (cards.value(state), card1 == card2, cards.isSoft(state), True, True, upCard, count)
+                choices = initialExpectations(card1, card2, upCard, upComposition, hitSoft17, splitRules)
+                if key not in sums:
+                    sums[key] = dict.fromkeys(choices, 0.0)
+                    weights[key] = 0.0
+                for choice in choices:
+                    sums[key][choice] += weight*choices[choice]
+                weights[key] += weight
+        for key in sums:
+            choices = {choice: sums[key][choice]/weights[key] for choice in sums[key]}
+            strategy[key] = _best(choices)
+            if surrender is not None:
+                surrender[key] = (choices["surrender"] > strategy[key][1], choices["surrender"])
+
+        # hands of three or more cards can only hit or stand. We don't know
+        # which cards made them, so we use the shoe without just the upCard.
+        for hard in range(6, 22):
+            choices = {
+                "stand": standEV(hard, 0, upCard, upComposition, hitSoft17),
+                "hit": hitEV(hard, 0, upCard, upComposition, upComposition, hitSoft17),
+            }
+            strategy[(hard, False, False, False, True, upCard, count)] = _best(choices)
+        for hard in range(3, 12):
+            choices = {
+                "stand": standEV(hard, 1, upCard, upComposition, hitSoft17),
+                "hit": hitEV(hard, 1, upCard, upComposition, upComposition, hitSoft17),
+            }
+            strategy[(hard + 10, False, True, False, True, upCard, count)] = _best(choices)
+    return strategy
+
+"""
+solves a strategy for each true count, using the same representative
+shoe for a count as strategy.bucketComposition
+"""
+def main(counts = (0,), decksLeft = 3, hitSoft17 = False, surrender = None, splitRules = DEFAULT_RULES):
+    strategy = {}
+    for count in counts:
+        composition = dealer.countComposition(count + 0.5, decksLeft)
+        strategy.update(solveStrategy(composition, count, hitSoft17, surrender, splitRules))
+    return strategy
+
+"""
+main for a rules.Rules: a half-played shoe of rules.decks decks, the
+dealer's soft 17 rule and the split rules. Solved tables are cached per
+ruleset and counts, so don't change the dictionary you get back.
+"""
+def solveRules(rules = DEFAULT_RULES, counts = (0,)):
+    return _solve(solverRules(rules), tuple(counts))[0]
+
+"""
+the surrender dictionary to go with solveRules(rules, counts), from the same solve
+"""
+def surrenderRules(rules = DEFAULT_RULES, counts = (0,)):
+    return _solve(solverRules(rules), tuple(counts))[1]
+
+"""
+the part of rules the solver depends on, so rulesets that differ only
+elsewhere (surrender, payouts, reshuffling) share one solve
+"""
+def solverRules(rules):
+    return Rules(decks = rules.decks, hitSoft17 = rules.hitSoft17, doubleAfterSplit = rules.doubleAfterSplit,
+                 maxHands = rules.maxHands, resplitAces = rules.resplitAces)
+
+@lru_cache(maxsize = 64)
+def _solve(rules, counts):
+    surrender = {}
+    strategy = main(counts, rules.decks/2, rules.hitSoft17, surrender, rules)
+    return strategy, surrender
+
+def _best(choices):
+    bestChoice = max(CHOICES, key = lambda choice: choices.get(choice, -10))
+    return (bestChoice, choices[bestChoice])
+
+def _without(composition, i):
+    counts = list(composition)
+    counts[i] -= 1
+    return tuple(counts)
@@ -0,0 +1,188 @@
+"""
+Online statistics for simulated games.
+
+histo.histogram keeps the profit of every game in memory, which is fine
+for thousands of games but not for hundreds of millions of rounds.
+An OnlineStats accumulator instead updates a fixed set of numbers as each
+round and game finishes:
+
+    (a) Welford mean/variance of the profit per game and per round
+    (b) a fixed-bin histogram of the profit per game
+    (c) a risk-of-ruin counter
+    (d) the EV and variance of a round (per unit bet) for each true count
+
+Its memory does not depend on how many games it has seen. Accumulators
+from different workers are combined with merge, and save/loadStats let a
+long run checkpoint itself and pick up where it left off.
+"""
+import math
+import numpy as np
+
+MIN_TC = -10
+MAX_TC = 10
+NUM_TCS = MAX_TC - MIN_TC + 1
+
+
+"""
+floors a true count and clamps it into [MIN_TC, MAX_TC],
+returning its index into the per-count arrays
+"""
+def tcIndex(trueCount):
+    tc = math.floor(trueCount)
+    if tc < MIN_TC:
+        tc = MIN_TC
+    elif tc > MAX_TC:
+        tc = MAX_TC
+    return tc - MIN_TC
+
+"""
+Running mean and variance (Welford's algorithm), mergeable with
+Chan's parallel update
+"""
+class Welford:
+    def __init__(self, count = 0, mean = 0.0, m2 = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta*other.count/count
+        self.m2 += other.m2 + delta*delta*self.count*other.count/count
+        self.count = count
+
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self.m2/(self.count - 1)
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+class OnlineStats:
+    def __init__(self, lower = -1000, upper = 1000, binWidth = 5, ruinLevel = 0):
+        self.lower = lower
+        self.upper = upper
+        self.binWidth = binWidth
+        self.ruinLevel = ruinLevel
+        self.games = Welford()
+        self.rounds = Welford()
+        # bins[0] and bins[-1] collect everything below lower / at or above upper
+        numBins = int(math.ceil((upper - lower)/binWidth))
+        self.bins = np.zeros(numBins + 2, dtype=np.int64)
+        self.numRuined = 0
+        # per true count: rounds played, mean and M2 of the profit per unit bet
+        self.tcRounds = np.zeros(NUM_TCS, dtype=np.int64)
+        self.tcMean = np.zeros(NUM_TCS)
+        self.tcM2 = np.zeros(NUM_TCS)
+        self.chunksDone = 0
+
+    """
+    records one round that won profit on an initial wager of bet,
+    played at the true count with index i (as tcIndex gives it)
+    """
+    def addRound(self, profit, bet, i):
+        if bet <= 0:
+            return
+        x = profit/bet
+        self.rounds.add(x)
+        n = self.tcRounds[i] + 1
+        self.tcRounds[i] = n
+        delta = x - self.tcMean[i]
+        self.tcMean[i] += delta/n
+        self.tcM2[i] += delta*(x - self.tcMean[i])
+
+    """
+    records one finished game, given its profit and the lowest bankroll
+    the player reached during it
+    """
+    def addGame(self, profit, lowestBankroll):
+        self.games.add(profit)
+        if profit < self.lower:
+            self.bins[0] += 1
+        elif profit >= self.upper:
+            self.bins[-1] += 1
+        else:
+            self.bins[1 + int((profit - self.lower)//self.binWidth)] += 1
+        if lowestBankroll <= self.ruinLevel:
+            self.numRuined += 1
+
+    def merge(self, other):
+        self.games.merge(other.games)
+        self.rounds.merge(other.rounds)
+        self.bins += other.bins
+        self.numRuined += other.numRuined
+        count = self.tcRounds + other.tcRounds
+        safe = np.maximum(count, 1)
+        delta = other.tcMean - self.tcMean
+        self.tcMean = self.tcMean + delta*other.tcRounds/safe
+        self.tcM2 = self.tcM2 + other.tcM2 + delta*delta*self.tcRounds*other.tcRounds/safe
+        self.tcRounds = count
+        self.chunksDone += other.chunksDone
+
+    def riskOfRuin(self):
+        if self.games.count == 0:
+            return 0.0
+        return self.numRuined/self.games.count
+
+    """
+    EV and variance of a round per unit bet, indexed by tcIndex
+    """
+    def tcExpectations(self):
+        variance = self.tcM2/np.maximum(self.tcRounds - 1, 1)
+        return self.tcMean.copy(), variance
+
+    def binEdges(self):
+        return self.lower + self.binWidth*np.arange(len(self.bins) - 1)
+
+    def summary(self):
+        return {
+            "games": self.games.count,
+            "mean": self.games.mean,
+            "std": self.games.std(),
+            "stdErr": self.games.std()/math.sqrt(max(self.games.count, 1)),
+            "rounds": self.rounds.count,
+            "roundEV": self.rounds.mean,
+            "roundStd": self.rounds.std(),
+            "riskOfRuin": self.riskOfRuin(),
+        }
+
+    # written through a file handle so numpy doesn't add .npz to path,
+    # which is where loadStats and the resume check look
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez(f,
+                config = np.array([self.lower, self.upper, self.binWidth, self.ruinLevel], dtype=float),
+                games = np.array([self.games.count, self.games.mean, self.games.m2]),
+                rounds = np.array([self.rounds.count, self.rounds.mean, self.rounds.m2]),
+                bins = self.bins,
+                numRuined = self.numRuined,
+                tcRounds = self.tcRounds,
+                tcMean = self.tcMean,
+                tcM2 = self.tcM2,
+                chunksDone = self.chunksDone)
+
+def loadStats(path):
+    data = np.load(path)
+    lower, upper, binWidth, ruinLevel = data["config"].tolist()
+    stats = OnlineStats(lower, upper, binWidth, ruinLevel)
+    count, mean, m2 = data["games"].tolist()
+    stats.games = Welford(int(count), mean, m2)
+    count, mean, m2 = data["rounds"].tolist()
+    stats.rounds = Welford(int(count), mean, m2)
+    stats.bins = data["bins"]
+    stats.numRuined = int(data["numRuined"])
+    stats.tcRounds = data["tcRounds"]
+    stats.tcMean = data["tcMean"]
+    stats.tcM2 = data["tcM2"]
+    stats.chunksDone = int(data["chunksDone"])
+    return stats
@@ -19,31 +19,108 @@ Finally, it would be best if we could save our computational work
 so we don't repeat it. 
 
 (3) Write out buckets to a txt file?
+    main(n, cacheDir=...) keeps a BucketStats store (.npz) per rule set in cacheDir,
+    so new shoes are merged into the earlier runs instead of starting over.
 """
 #TODO: write the function currentValue so it assigns a value of 21.5 to a natural
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import os
 import random
 import matplotlib.pyplot as plt
+import cards
+import dealer
+from cards import ACE
+from rules import DEFAULT_RULES, MAX_SPLIT_HANDS
 
 SUITS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-DECK = 4*["A", 2, 3,4,5,6,7,8,9,10,10,10,10]
-DECKS_PER_SHOE = 6
+DECK = cards.DECK
+# the defaults; makeBuckets, summarize and main take their rules from a rules.Rules
+DECKS_PER_SHOE = DEFAULT_RULES.decks
+HIT_SOFT_17 = DEFAULT_RULES.hitSoft17
 # In any given round, the dealer hits to at most 26 and the player hits to at most 31
 MAX_ROUND_VALUE = 57
+SHOES_PER_SHARD = 100
+HILO_VALUES = np.array(cards.HILO)
 MIN_COUNT = -3
 MAX_COUNT = 8
 
+"""
+Bucket keys are the 7-tuple (value, canSplit, isSoft, canDouble, canHit, upCard, TC),
+where upCard and TC may be None. The codec below packs a key into a dense
+integer in range(NUM_KEYS), which is what buckets are keyed on and what the
+expectation arrays are indexed by. decodeKey gives the tuple back.
+"""
+NUM_VALUES = 24 # -1, 21.5, and 0 through 21
+NUM_UPCARDS = 11 # None, and 1 through 10
+NUM_COUNTS = MAX_COUNT - MIN_COUNT + 2 # None, and MIN_COUNT through MAX_COUNT
+NUM_KEYS = NUM_VALUES*16*NUM_UPCARDS*NUM_COUNTS
+
+def packKey(value, canSplit, isSoft, canDouble, canHit, upCard, count):
+    if value == -1:
+        valueIndex = 0
+    elif value == 21.5:
+        valueIndex = 1
+    else:
+        valueIndex = value + 2
+    flags = 8*canSplit + 4*isSoft + 2*canDouble + canHit
+    upIndex = 0 if upCard is None else upCard
+    countIndex = 0 if count is None else count - MIN_COUNT + 1
+    return ((valueIndex*16 + flags)*NUM_UPCARDS + upIndex)*NUM_COUNTS + countIndex
+
+def encodeKey(key):
+    return packKey(*key)
+
+def decodeKey(keyIndex):
+    keyIndex, countIndex = divmod(keyIndex, NUM_COUNTS)
+    keyIndex, upIndex = divmod(keyIndex, NUM_UPCARDS)
+    valueIndex, flags = divmod(keyIndex, 16)
+    value = (-1, 21.5)[valueIndex] if valueIndex < 2 else valueIndex - 2
+    upCard = None if upIndex == 0 else upIndex
+    count = None if countIndex == 0 else countIndex + MIN_COUNT - 1
+    return (value, bool(flags & 8), bool(flags & 4), bool(flags & 2), bool(flags & 1), upCard, count)
+
+# the fields of every key index, decoded once for the whole index space
+_keyIndices = np.arange(NUM_KEYS)
+KEY_COUNT_INDEX = _keyIndices % NUM_COUNTS
+KEY_UPCARD = (_keyIndices // NUM_COUNTS) % NUM_UPCARDS
+_keyFlags = (_keyIndices // (NUM_COUNTS*NUM_UPCARDS)) % 16
+_keyValueIndex = _keyIndices // (NUM_COUNTS*NUM_UPCARDS*16)
+KEY_VALUE = np.where(_keyValueIndex == 0, -1, np.where(_keyValueIndex == 1, 21.5, _keyValueIndex - 2))
+KEY_CAN_SPLIT = (_keyFlags & 8) > 0
+KEY_IS_SOFT = (_keyFlags & 4) > 0
+KEY_CAN_DOUBLE = (_keyFlags & 2) > 0
+KEY_CAN_HIT = (_keyFlags & 1) > 0
+# the key a hand moves to when it stands: the same value, upCard and count with every flag cleared
+STAND_KEY = _keyIndices - _keyFlags*NUM_UPCARDS*NUM_COUNTS
+
+# Choices are stored as small codes in the bestChoice array
+CHOICES = ("stand", "hit", "double", "split")
+STAND, HIT, DOUBLE, SPLIT = range(4)
+NO_CHOICE = -1
+# surrendering gives back half the bet
+SURRENDER_EV = -0.5
 
+
+"""
+cardList holds the two cards the hand was dealt; everything drawn after
+that only lives in the incremental state.
+"""
 class Hand:
+    __slots__ = ("bet", "cardList", "state", "value", "isBJ", "canHit", "canDouble", "canSplit", "isSoft")
+
     def __init__(self, handList, wager = 0,  mustStand = False):
         self.bet = wager
         self.cardList = handList
-        self.value = currentValue(handList)
+        self.state = cards.handState(handList)
+        self.value = cards.value(self.state)
         self.isBJ = self.value == 21.5
         self.canHit = not(mustStand) and self.value > 0 and not(self.isBJ)
         self.canDouble = (self.canHit and len(handList) == 2)
         self.canSplit = self.canDouble and (handList[0] == handList[1])
-        self.isSoft = isSoft(handList) and self.canHit
+        self.isSoft = cards.isSoft(self.state) and self.canHit
 
     def __repr__(self):
         string = "a"
@@ -66,8 +143,12 @@ class Hand:
         return string
 
     def deepCopy(self):
-        mustStand = not(self.canHit)
-        return Hand([card for card in self.cardList], self.bet, mustStand)
+        # state is an immutable tuple and cardList is never changed in place,
+        # so the copy can share both
+        newHand = Hand.__new__(Hand)
+        for name in Hand.__slots__:
+            setattr(newHand, name, getattr(self, name))
+        return newHand
 
     def __eq__(self, other):
         #the following conditions must hold:
@@ -90,11 +171,11 @@ class Hand:
 
     def hit(self, newCard):
         if self.canHit:
-            self.cardList.append(newCard)
-            self.value = currentValue(self.cardList)
+            self.state = cards.addCard(self.state, newCard)
+            self.value = cards.value(self.state)
             if self.value == -1:
                 self.canHit = False
-            self.isSoft = isSoft(self.cardList)
+            self.isSoft = cards.isSoft(self.state)
             self.canDouble = False
             self.canSplit = False
         else:
@@ -110,25 +191,42 @@ class Hand:
         else:
             print("not allowed to double down on this hand")
     
+    """
+    the two hands this pair becomes, each dealt one of newCards, as they
+    are dealt: the rules on split hands (split Aces stand, a split 21 is no
+    blackjack, doubling after a split) are applied by splitExpectations
+    """
     def split(self, newCards):
         if self.canSplit:
-            if self.cardList == ["A", "A"]:
-                self.cardList = ["A", newCards[0]]
-                self.canHit = False
+            return [Hand([self.cardList[0], newCard], self.bet) for newCard in newCards]
         else:
             print("not allowed to split this hand")
+            return []
     
+"""
+A Block doesn't own its extra cards: it points into the card buffer it was
+dealt from, and offset is the position of the next card to draw. Children
+share their parent's buffer and just move the offset along.
+Blocks only live while makeBuckets expands them; bucket and row say where
+the block's columns were stored.
+"""
 class Block:
-    def __init__(self, hand, upCard, dCard, extraCards, runningCount, numCardsDealt):
+    __slots__ = ("hand", "upCard", "dCard", "cards", "offset", "rc", "numCardsDealt", "decks", "stChild", "hChild", "key", "bucket", "row")
+
+    def __init__(self, hand, upCard, dCard, cardBuffer, offset, runningCount, numCardsDealt, decks = DECKS_PER_SHOE):
         self.hand = hand
         self.upCard = upCard
         self.dCard = dCard
-        self.extraCards = extraCards
+        self.cards = cardBuffer
+        self.offset = offset
         self.rc = runningCount
         self.numCardsDealt = numCardsDealt
+        self.decks = decks
         self.stChild = None
         self.hChild = None
         self.key = self.getKey()
+        self.bucket = None
+        self.row = None
 
     def __repr__(self):
         string = "Dealer's upCard: "+ str(self.upCard) + "\n"
@@ -137,34 +235,30 @@ class Block:
         return string
     
     def getKey(self):
-        #return (self.hand.value, self.hand.isSoft, self.hand.canHit, hardValue([self.upCard]))
-        #return (self.hand.value, self.hand.isSoft, self.hand.canHit, hardValue([self.upCard]), self.getTC())
-        if self.hand.value == -1:
-            return (-1, False, False, False, False, None, None) # this makes 120 keys into one.
-        elif self.hand.value == 21.5:
-            if self.upCard == "A":
-                return (21.5, False, False, False, False, 1, self.getTC())
-            elif self.upCard == 10:
-                return (21.5, False, False, False, False, 10, self.getTC())
-            else:
-                return (21.5, False, False, False, False, None, None)
-        else:
-            return (self.hand.value, self.hand.canSplit, self.hand.isSoft, self.hand.canDouble, self.hand.canHit, hardValue([self.upCard]), self.getTC())
+        return handKey(self.hand, self.upCard, self.getTC())
 
     def getTC(self):
-        cardsPerShoe = 52*DECKS_PER_SHOE
-        numDecksLeft = (cardsPerShoe - self.numCardsDealt)/52
-        TrueCount = int(self.rc//numDecksLeft)
-        if TrueCount > MAX_COUNT:
-            TrueCount = MAX_COUNT
-        elif TrueCount < MIN_COUNT:
-            TrueCount = MIN_COUNT
-        return TrueCount
+        return trueCount(self.rc, self.numCardsDealt, self.decks)
+
+    @property
+    def extraCards(self):
+        return self.cards[self.offset:]
 
     def deepCopy(self):
-        newHand = self.hand.deepCopy()
-        newCards = [card for card in self.extraCards]
-        newBlock = Block(newHand, self.upCard, self.dCard, newCards, self.rc, self.numCardsDealt)
+        newBlock = Block.__new__(Block)
+        newBlock.hand = self.hand.deepCopy()
+        newBlock.upCard = self.upCard
+        newBlock.dCard = self.dCard
+        newBlock.cards = self.cards
+        newBlock.offset = self.offset
+        newBlock.rc = self.rc
+        newBlock.numCardsDealt = self.numCardsDealt
+        newBlock.decks = self.decks
+        newBlock.stChild = None
+        newBlock.hChild = None
+        newBlock.key = self.key
+        newBlock.bucket = None
+        newBlock.row = None
         return newBlock
     
     def stand(self):
@@ -173,22 +267,63 @@ class Block:
 
     def hit(self):
         if self.hand.canHit:
-            newCard = self.extraCards[0]
+            newCard = self.cards[self.offset]
             self.hand.hit(newCard)
-            self.extraCards = self.extraCards[1:]
-            self.rc += countValue(newCard)
+            self.offset += 1
+            self.rc += cards.HILO[newCard]
             self.numCardsDealt += 1
             self.key = self.getKey()
            
+"""
+the packed key of a hand against upCard at true count count
+"""
+def handKey(hand, upCard, count):
+    if hand.value == -1:
+        return packKey(-1, False, False, False, False, None, None) # this makes 120 keys into one.
+    elif hand.value == 21.5:
+        if upCard == ACE or upCard == 10:
+            return packKey(21.5, False, False, False, False, upCard, count)
+        else:
+            return packKey(21.5, False, False, False, False, None, None)
+    else:
+        return packKey(hand.value, hand.canSplit, hand.isSoft, hand.canDouble, hand.canHit, upCard, count)
+
+def trueCount(runningCount, numCardsDealt, decks = DECKS_PER_SHOE):
+    cardsPerShoe = 52*decks
+    numDecksLeft = (cardsPerShoe - numCardsDealt)/52
+    TrueCount = int(runningCount//numDecksLeft)
+    if TrueCount > MAX_COUNT:
+        TrueCount = MAX_COUNT
+    elif TrueCount < MIN_COUNT:
+        TrueCount = MIN_COUNT
+    return TrueCount
+
+"""
+A Bucket doesn't keep its blocks, just one compact column per field we need
+from them later: the dealer's cards, where the block's remaining cards start
+in the shared card buffer, the count, and the key ids of the block's stand,
+hit and double children (-1 until the block is expanded).
+"""
 class Bucket: 
+    __slots__ = ("hand", "upCard", "count", "key", "cards", "decks",
+                 "upCards", "dCards", "offsets", "rcs", "dealt", "stKeys", "hKeys", "dKeys")
+
     def __init__(self, block):
         self.hand = block.hand
         self.upCard = block.upCard
         self.count = block.getTC()
-        self.blocks = [block]
         self.key = block.key
-        self.expectation = None
-        self.bestChoice = None
+        self.cards = block.cards
+        self.decks = block.decks
+        self.upCards = array("b")
+        self.dCards = array("b")
+        self.offsets = array("i")
+        self.rcs = array("h")
+        self.dealt = array("h")
+        self.stKeys = array("i")
+        self.hKeys = array("i")
+        self.dKeys = array("i")
+        self.append(block)
     
     def __eq__(self, other):
         #these are the conditions:
@@ -198,75 +333,75 @@ class Bucket:
         return c1 and c2 and c3
     
     def __repr__(self):
-        return str(self.blocks[0])
+        string = "Dealer's upCard: "+ str(self.upCard) + "\n"
+        string += "Your Hand: " + str(self.hand) + "\n"
+        string += "True Count: "+ str(self.count) + "\n "
+        return string
 
     def append(self, newBlock):
-        self.blocks.append(newBlock)
+        newBlock.bucket = self
+        newBlock.row = len(self.offsets)
+        self.upCards.append(newBlock.upCard)
+        self.dCards.append(newBlock.dCard)
+        self.offsets.append(newBlock.offset)
+        self.rcs.append(newBlock.rc)
+        self.dealt.append(newBlock.numCardsDealt)
+        self.stKeys.append(-1)
+        self.hKeys.append(-1)
+        self.dKeys.append(-1)
+
+    """
+    records the children of the block stored in row
+    """
+    def setChildren(self, row, stChild, hChild, dChildKey):
+        self.stKeys[row] = stChild.key
+        self.hKeys[row] = hChild.key
+        self.dKeys[row] = dChildKey
 
     def size(self):
-        return len(self.blocks)
+        return len(self.offsets)
 
 def isSoft(handList):
-    copy = [element for element in handList]
-    if "A" in copy:
-        copy.remove("A")
-        num_extra_Aces = 0
-        while "A" in copy:
-            num_extra_Aces += 1
-            copy.remove("A")
-        softValue = 11 + num_extra_Aces + sum(copy)
-        return softValue <= 21
-    else:
-        return False
+    return cards.isSoft(cards.handState(handList))
 
 def currentValue(hand):
-    if hand in [["A", 10], [10, "A"]]:
-        return 21.5
-    if isSoft(hand):
-        return 10 + hardValue(hand)
-    if hardValue(hand) > 21:
-        return -1
-    else:
-        return hardValue(hand)
+    return cards.value(cards.handState(hand))
 
 def hardValue(hand):
-    copy = [element for element in hand]
-    numAces = 0
-    while "A" in copy:
-        numAces += 1
-        copy.remove("A")
-    return numAces + sum(copy)
-
-def makeBuckets(numShoes):
+    return sum(hand)
+
+"""
+Deals numShoes shoes into blocks and expands each block's stand/hit tree
+breadth first. Every block of a shoe is kept in one list (the arena) and
+the queue holds positions in it. The carved cards of every shoe go into one
+shared buffer, which the buckets' offsets point into.
+Shoes are shuffled with rng (the random module unless given; a
+shoebank.ShoeStream deals a bank's shoes), and hold rules.decks decks.
+"""
+def makeBuckets(numShoes, rng = random, rules = DEFAULT_RULES):
     buckets = {}
+    cardBuffer = array("b")
     for i in range(numShoes):
-        hitQueue = []
-        shoe = DECKS_PER_SHOE*DECK
-        random.shuffle(shoe)
-        shoeTotal = DECKS_PER_SHOE*hardValue(DECK)
-        runningCount = 0
-        cardsDealt = 0
-        while shoeTotal >= MAX_ROUND_VALUE:
-            cardList = carveBlock(shoe)
-            shoe = shoe[len(cardList):]
-            shoeTotal -= hardValue(cardList)
-
-            tempRC = runningCount
-            tempCD = cardsDealt
-            runningCount += sum([countValue(card) for card in cardList])
-            cardsDealt += len(cardList)
-            playerHand = Hand(cardList[0:2])
-            upCard = cardList[2]
-            dCard = cardList[3]
-            remaining = cardList[4:]
-            tempRC += sum([countValue(card) for card in cardList[0:3]])
-            tempCD += 3
-            newBlock = Block(playerHand, upCard, dCard, remaining, tempRC, tempCD)
-            hitQueue.append(newBlock)
+        arena = []
+        hitQueue = deque()
+        shoe = rules.decks*DECK
+        rng.shuffle(shoe)
+        starts, counts = carveShoe(shoe)
+        # a block's cards are worth at least MAX_ROUND_VALUE, so no round
+        # ever reads past its own block and the whole shoe can go in the buffer
+        base = len(cardBuffer)
+        cardBuffer.extend(shoe)
+        for start, count in zip(starts, counts):
+            # the count is taken once the player's cards and the upCard are out
+            playerHand = Hand(shoe[start:start + 2])
+            upCard = shoe[start + 2]
+            dCard = shoe[start + 3]
+            newBlock = Block(playerHand, upCard, dCard, cardBuffer, base + start + 4, count, start + 3, rules.decks)
+            arena.append(newBlock)
+            hitQueue.append(len(arena) - 1)
             addBlocktoBuckets(newBlock, buckets)
         while len(hitQueue) > 0:
-            parent = hitQueue[0]
-            hitQueue = hitQueue[1:]
+            parent = arena[hitQueue.popleft()]
             if parent.hand.canHit:
                 stChild = parent.deepCopy()
                 stChild.stand()
@@ -277,8 +412,17 @@ def makeBuckets(numShoes):
                 hChild.hit()
                 addBlocktoBuckets(hChild, buckets)
                 parent.hChild = hChild
+                # doubling is hitting once and then standing
+                dChildKey = hChild.key
                 if hChild.hand.canHit:
-                    hitQueue.append(hChild)
+                    dChild = hChild.deepCopy()
+                    dChild.stand()
+                    dChildKey = dChild.key
+                parent.bucket.setChildren(parent.row, stChild, hChild, dChildKey)
+                arena.append(stChild)
+                arena.append(hChild)
+                if hChild.hand.canHit:
+                    hitQueue.append(len(arena) - 1)
     return buckets
 
 def addBlocktoBuckets(newBlock, buckets):
@@ -287,258 +431,570 @@ def addBlocktoBuckets(newBlock, buckets):
     else:
         buckets[newBlock.key] = Bucket(newBlock)
 
-def carveBlock(shoe):
-    finalIndex = 0
-    while hardValue(shoe[:finalIndex]) < MAX_ROUND_VALUE:
-        finalIndex += 1
-    return shoe[:finalIndex]
+"""
+Cuts a shoe into blocks: each block is the shortest run of cards, from where
+the last one ended, whose hard values add up to at least MAX_ROUND_VALUE.
+With cumulative sums of the hard and Hi-Lo values, every possible block end
+is found with one searchsorted, and we only have to follow the chain from
+the first card. Returns the index of each block's first card, and the running
+count after its first three cards.
+"""
+def carveShoe(shoe):
+    shoe = np.asarray(shoe)
+    hardSums = np.concatenate(([0], np.cumsum(shoe)))
+    countSums = np.concatenate(([0], np.cumsum(HILO_VALUES[shoe])))
+    ends = np.searchsorted(hardSums, hardSums[:-1] + MAX_ROUND_VALUE).tolist()
+    starts = []
+    start = 0
+    while start < len(shoe) and ends[start] < len(hardSums):
+        starts.append(start)
+        start = ends[start]
+    starts = np.array(starts, dtype=np.int64)
+    return starts.tolist(), countSums[starts + 3].tolist()
 
 """ 
 Assigns cards values according to the Hi-Lo system.
 """
 def countValue(card):
-    if card in ["A", 10]:
-        return -1
-    elif card in [7, 8, 9]:
-        return 0
-    else: # card in [2,3,4,5,6]
-        return 1
+    return cards.HILO[card]
+
+"""
+Divide classifies the buckets into 6 categories: stand, high hard, soft, low hard, double and split.
+Each category is a boolean mask over the key indices, true for the keys we have a bucket for.
+"""
+CATEGORY_STAND = ~KEY_CAN_HIT
+CATEGORY_SPLIT = KEY_CAN_HIT & KEY_CAN_SPLIT
+CATEGORY_DOUBLE = KEY_CAN_HIT & KEY_CAN_DOUBLE & ~KEY_CAN_SPLIT
+_canOnlyHit = KEY_CAN_HIT & ~KEY_CAN_DOUBLE & ~KEY_CAN_SPLIT
+CATEGORY_SOFT = _canOnlyHit & KEY_IS_SOFT
+CATEGORY_HIGH = _canOnlyHit & ~KEY_IS_SOFT & (KEY_VALUE > 10)
+CATEGORY_LOW = _canOnlyHit & ~KEY_IS_SOFT & (KEY_VALUE <= 10)
+
+def divide(stats):
+    present = stats.counts > 0
+    return tuple(present & category for category in
+        (CATEGORY_STAND, CATEGORY_HIGH, CATEGORY_SOFT, CATEGORY_LOW, CATEGORY_DOUBLE, CATEGORY_SPLIT))
 
 """
-Divide classifies the buckets into 4 categories: stand, soft, high hard, and low hard.
+dealerPlay defaults to a S17 game (i.e., dealer stands on Soft 17)
+"""
+def dealerPlay(initialCards, hitList, start = 0, hitSoft17 = HIT_SOFT_17):
+    state = cards.handState(initialCards)
+    i = start
+    while cards.total(state) < 17 or (hitSoft17 and cards.total(state) == 17 and cards.isSoft(state)):
+        state = cards.addCard(state, hitList[i])
+        i += 1
+    return cards.value(state)
+
+"""
+Plays many dealer hands at once, in lockstep: every round, each hand that
+still has to hit takes the next card at its own offset in cardBuffer.
+Takes arrays of upCards, hole cards and offsets and returns the dealer's
+values (as cards.value, so 21.5 is a blackjack and -1 a bust) as an array.
+"""
+def dealerPlayBatch(upCards, holeCards, offsets, cardBuffer, hitSoft17 = HIT_SOFT_17):
+    upCards = np.asarray(upCards, dtype=np.int64)
+    holeCards = np.asarray(holeCards, dtype=np.int64)
+    positions = np.array(offsets, dtype=np.int64)
+    cardBuffer = np.asarray(cardBuffer)
+    hard = upCards + holeCards
+    hasAce = (upCards == ACE) | (holeCards == ACE)
+    natural = hasAce & (hard == 11)
+    while True:
+        soft = hasAce & (hard <= 11)
+        total = np.where(soft, hard + 10, hard)
+        hitting = (total < 17) | (hitSoft17 & soft & (total == 17))
+        if not hitting.any():
+            break
+        newCards = cardBuffer[positions[hitting]]
+        hard[hitting] += newCards
+        hasAce[hitting] |= newCards == ACE
+        positions[hitting] += 1
+    values = np.where(total > 21, cards.BUST, total).astype(float)
+    values[natural] = cards.NATURAL
+    return values
+
+"""
+Transitions counts how often a block in one bucket (the parent) moved to
+another (the child), as three aligned arrays sorted by (parent, child).
+"""
+class Transitions:
+    __slots__ = ("parents", "children", "counts")
+
+    def __init__(self, parents = None, children = None, counts = None):
+        if parents is None:
+            parents = np.zeros(0, dtype=np.int64)
+            children = np.zeros(0, dtype=np.int64)
+        if counts is None:
+            counts = np.ones(len(parents), dtype=np.int64)
+        pairs = np.asarray(parents, dtype=np.int64)*NUM_KEYS + np.asarray(children, dtype=np.int64)
+        pairs, inverse = np.unique(pairs, return_inverse = True)
+        self.parents = pairs // NUM_KEYS
+        self.children = pairs % NUM_KEYS
+        self.counts = np.bincount(inverse, weights = counts, minlength = len(pairs)).astype(np.int64)
+
+    def merge(self, other):
+        merged = Transitions(np.concatenate((self.parents, other.parents)),
+                             np.concatenate((self.children, other.children)),
+                             np.concatenate((self.counts, other.counts)))
+        self.parents, self.children, self.counts = merged.parents, merged.children, merged.counts
+
+"""
+BucketStats holds everything the expectation pass needs from the buckets,
+as sufficient statistics that can simply be added up:
+    (a) counts: how many blocks landed in each bucket
+    (b) wins, losses, pushes: how the stand buckets fared against the dealer
+    (c) hit, double, split: which buckets the blocks moved to on each choice
+        (split children are recorded before any filtering, see splitExpectations)
+    (d) aceHands, aceTens: per count index, how many rounds were dealt an
+        Ace upCard and how many of those had a ten in the hole (for insurance)
+Unlike the buckets themselves, stats from different runs can be merged, and
+they can be saved to disk and loaded again.
 """
-def divide(buckets):
+class BucketStats:
+    __slots__ = ("counts", "wins", "losses", "pushes", "hit", "double", "split", "aceHands", "aceTens", "numShoes")
+
+    def __init__(self):
+        self.counts = np.zeros(NUM_KEYS, dtype=np.int64)
+        self.wins = np.zeros(NUM_KEYS, dtype=np.int64)
+        self.losses = np.zeros(NUM_KEYS, dtype=np.int64)
+        self.pushes = np.zeros(NUM_KEYS, dtype=np.int64)
+        self.hit = Transitions()
+        self.double = Transitions()
+        self.split = Transitions()
+        self.aceHands = np.zeros(NUM_COUNTS, dtype=np.int64)
+        self.aceTens = np.zeros(NUM_COUNTS, dtype=np.int64)
+        self.numShoes = 0
+
+    def merge(self, other):
+        self.counts += other.counts
+        self.wins += other.wins
+        self.losses += other.losses
+        self.pushes += other.pushes
+        self.aceHands += other.aceHands
+        self.aceTens += other.aceTens
+        self.hit.merge(other.hit)
+        self.double.merge(other.double)
+        self.split.merge(other.split)
+        self.numShoes += other.numShoes
+
+    def save(self, path, rules = DEFAULT_RULES):
+        arrays = {"config": np.array(ruleConfig(rules)), "numShoes": self.numShoes}
+        for name in ("counts", "wins", "losses", "pushes", "aceHands", "aceTens"):
+            arrays[name] = getattr(self, name)
+        for name in ("hit", "double", "split"):
+            transitions = getattr(self, name)
+            arrays[name] = np.stack((transitions.parents, transitions.children, transitions.counts))
+        np.savez_compressed(path, **arrays)
 
-    stBuckets = {}
-    hardBucketsHigh = {}
-    softBuckets = {}
-    hardBucketsLow = {}
-    doubleBuckets = {}
-    splitBuckets = {}
+"""
+The on-disk store is only valid for the rules and key layout it was built
+with, so every file records them and refuses to load under other rules.
+Of the rules, only the decks and the dealer's soft 17 change the statistics;
+everything else is applied when the expectations are worked out.
+"""
+STORE_VERSION = 2
+
+def ruleConfig(rules = DEFAULT_RULES):
+    return (STORE_VERSION, rules.decks, int(rules.hitSoft17), MIN_COUNT, MAX_COUNT)
+
+def cachePath(directory, rules = DEFAULT_RULES):
+    name = "buckets-v%d-%dd-%s-tc%d_%d.npz" % (STORE_VERSION, rules.decks, "H17" if rules.hitSoft17 else "S17", MIN_COUNT, MAX_COUNT)
+    return os.path.join(directory, name)
+
+def loadBucketStats(path, rules = DEFAULT_RULES):
+    data = np.load(path)
+    if tuple(data["config"].tolist()) != ruleConfig(rules):
+        raise ValueError("bucket store " + path + " was built with different rules: " + str(data["config"].tolist()))
+    stats = BucketStats()
+    for name in ("counts", "wins", "losses", "pushes", "aceHands", "aceTens"):
+        setattr(stats, name, data[name])
+    for name in ("hit", "double", "split"):
+        parents, children, counts = data[name]
+        setattr(stats, name, Transitions(parents, children, counts))
+    stats.numShoes = int(data["numShoes"])
+    return stats
 
+"""
+Boils the buckets of one run down to their sufficient statistics:
+stand buckets play out the dealer against every block, and hittable
+buckets record the keys their blocks' children landed in. The buckets of
+the hands as dealt (two cards, or a blackjack) tally the Ace upCards.
+"""
+def summarize(buckets, numShoes = 0, rules = DEFAULT_RULES):
+    stats = BucketStats()
+    stats.numShoes = numShoes
+    hitPairs, doublePairs, splitPairs = [], [], []
+    standColumns = []
+    cardBuffer = None
     for key in buckets:
-        h = buckets[key].hand
-
-        if h.canSplit:
-            splitBuckets[key] = buckets[key]
-        elif h.canDouble:
-            doubleBuckets[key] = buckets[key]   
-        elif h.canHit:
-            if h.isSoft:
-                softBuckets[key] = buckets[key]
-            elif h.value > 10:
-                hardBucketsHigh[key] = buckets[key]
-            else:
-                hardBucketsLow[key] = buckets[key]
-        else:
-            stBuckets[key] = buckets[key]
-    return (stBuckets, hardBucketsHigh, softBuckets, hardBucketsLow, doubleBuckets, splitBuckets)
+        b = buckets[key]
+        n = b.size()
+        stats.counts[key] = n
+        if KEY_UPCARD[key] == ACE and (KEY_CAN_DOUBLE[key] or KEY_VALUE[key] == 21.5):
+            stats.aceHands[KEY_COUNT_INDEX[key]] += n
+            stats.aceTens[KEY_COUNT_INDEX[key]] += b.dCards.count(10)
+        if not KEY_CAN_HIT[key]:
+            if KEY_VALUE[key] != -1:
+                standColumns.append((np.full(n, key, dtype=np.int64), b.upCards, b.dCards, b.offsets))
+                cardBuffer = b.cards
+            continue
+        parents = np.full(n, key, dtype=np.int64)
+        hitPairs.append((parents, columnKeys(b.hKeys)))
+        if KEY_CAN_DOUBLE[key]:
+            doublePairs.append((parents, columnKeys(b.dKeys)))
+        if KEY_CAN_SPLIT[key]:
+            children = splitChildren(b)
+            splitPairs.append((np.full(len(children), key, dtype=np.int64), children))
+    # every stand block of the run plays against the dealer in one batch
+    if standColumns:
+        standKeys = np.concatenate([column[0] for column in standColumns])
+        upCards, dCards, offsets = [np.concatenate([np.frombuffer(column[i], dtype=column[i].typecode)
+                                                    for column in standColumns]) for i in (1, 2, 3)]
+        dealerValues = dealerPlayBatch(upCards, dCards, offsets, np.frombuffer(cardBuffer, dtype=np.int8), rules.hitSoft17)
+        values = KEY_VALUE[standKeys]
+        stats.wins += np.bincount(standKeys, weights = values > dealerValues, minlength = NUM_KEYS).astype(np.int64)
+        stats.losses += np.bincount(standKeys, weights = values < dealerValues, minlength = NUM_KEYS).astype(np.int64)
+        stats.pushes += np.bincount(standKeys, weights = values == dealerValues, minlength = NUM_KEYS).astype(np.int64)
+    for name, pairs in (("hit", hitPairs), ("double", doublePairs), ("split", splitPairs)):
+        if pairs:
+            parents = np.concatenate([p for p, c in pairs])
+            children = np.concatenate([c for p, c in pairs])
+            setattr(stats, name, Transitions(parents, children))
+    return stats
+
+def columnKeys(column):
+    return np.frombuffer(column, dtype=np.intc)
 
 """
-dealerPlay defaults to a S17 game (i.e., dealer stands on Soft 17)
+the keys of the two hands every block of a split bucket would become:
+the pair card plus each of the next two cards, at the count after both
 """
-def dealerPlay(initialCards, hitList):
-    dealerCards = [card for card in initialCards]
-    i = 0
-    while currentValue(dealerCards) in range(0,17):
-        dealerCards += [hitList[i]]
-        i += 1
-    return currentValue(dealerCards)
+def splitChildren(b):
+    hand = b.hand
+    children = []
+    for row in range(b.size()):
+        # Note: we are guaranteed at least two extraCards, for a splittable hand
+        offset = b.offsets[row]
+        nextCards = [b.cards[offset], b.cards[offset + 1]]
+        countShift = cards.HILO[nextCards[0]] + cards.HILO[nextCards[1]]
+        splitCount = trueCount(b.rcs[row] + countShift, b.dealt[row] + 2, b.decks)
+        for newHand in hand.split(nextCards):
+            children.append(handKey(newHand, b.upCard, splitCount))
+    return np.array(children, dtype=np.int64)
+
+"""
+attaches a simplified estimate of expectation to each situation.
+Takes BucketStats (or a dictionary of buckets, which gets summarized first)
+and returns (expectations, bestChoices): flat arrays indexed by key index,
+holding NaN / NO_CHOICE for keys we have no data for.
+"""
+def makeExpectations(stats, exact = False, rules = DEFAULT_RULES):
+    if isinstance(stats, dict):
+        stats = summarize(stats, rules = rules)
+    expectations = np.full(NUM_KEYS, np.nan)
+    bestChoices = np.full(NUM_KEYS, NO_CHOICE, dtype=np.int8)
+    stand, high, soft, low, double, split = divide(stats)
+    standExpectations(stats, stand, expectations, exact, rules)
+    # hitting only ever leads to a stand, high, or higher valued soft or low
+    # hand, so we work through each category from the highest value down.
+    # Keys of the same category and value never depend on each other.
+    for mask in (high, soft, low, double, split):
+        keys = np.flatnonzero(mask)
+        for value in np.unique(KEY_VALUE[keys])[::-1]:
+            setExpectations(stats, keys[KEY_VALUE[keys] == value], expectations, bestChoices, rules)
+    return expectations, bestChoices
+
+"""
+The chance of a ten in the hole under an Ace, per count index (as
+KEY_COUNT_INDEX), from the Ace upCards the buckets were dealt or, if
+exact, from bucketComposition. NaN where there is no data.
+"""
+def holeTenChances(stats, exact = False, rules = DEFAULT_RULES):
+    if exact:
+        chances = np.full(NUM_COUNTS, np.nan)
+        for count in range(MIN_COUNT, MAX_COUNT + 1):
+            composition = bucketComposition(ACE, count, rules.decks)
+            chances[count - MIN_COUNT + 1] = composition[cards.TEN - 1]/sum(composition)
+        return chances
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return stats.aceTens/stats.aceHands
+
+"""
+The expectation of surrendering each of keys (two card hands). Only an
+Ace upCard is checked for blackjack first (see histo.checkInsurance), so
+against an Ace the player can only surrender when the dealer has none:
+it is worth SURRENDER_EV then and -1 otherwise. Against anything else it
+is SURRENDER_EV.
+"""
+def surrenderExpectations(stats, keys, exact = False, rules = DEFAULT_RULES):
+    holeTens = holeTenChances(stats, exact, rules)[KEY_COUNT_INDEX[keys]]
+    aceExp = np.where(np.isnan(holeTens), SURRENDER_EV, -holeTens + (1 - holeTens)*SURRENDER_EV)
+    return np.where(KEY_UPCARD[keys] == ACE, aceExp, SURRENDER_EV)
+
+"""
+Surrender goes alongside the strategy rather than in it: a hand that has
+been split reaches the same keys and can't surrender, so strategyTable
+keeps the best way to play on. Returns {key: (surrenders, expectation)}
+for every two card hand with data, where surrenders says whether giving
+up half the bet beats playing on (never, without surrender in the rules).
+"""
+def surrenderTable(stats, exact = False, rules = DEFAULT_RULES):
+    if isinstance(stats, dict):
+        stats = summarize(stats, rules = rules)
+    expectations, _ = makeExpectations(stats, exact, rules)
+    _, _, _, _, double, split = divide(stats)
+    keys = np.flatnonzero(double | split)
+    surrenderExp = surrenderExpectations(stats, keys, exact, rules)
+    surrenders = (surrenderExp > expectations[keys]) & (rules.surrender != "none")
+    table = {}
+    for key, surrenders, expectation in zip(keys.tolist(), surrenders.tolist(), surrenderExp.tolist()):
+        table[decodeKey(key)] = (surrenders, expectation)
+    return table
 
 """
-attaches a simplified estimate of expectation to each situation
-assuming two choices: hit or stand.
+Insurance costs half the bet and pays 2 to 1 if the dealer has a ten in
+the hole, so per unit insured it is worth 3p - 1 for a chance p of that.
+Returns {count: (insure, expectation)} for every count with data,
+where insure says whether the expectation is positive.
 """
-def makeExpectations(buckets):
-    stand, high, soft, low, double, split = divide(buckets)
-    standExpectations(stand)
-    highExpectations(high, stand)
-    softExpectations(soft, high, stand)
-    lowExpectations(low, soft, high, stand)
-    doubleExpectations(double, low, soft, high, stand)
-    splitExpectations(split, double, low, soft, high, stand)
+def insuranceTable(stats, exact = False, rules = DEFAULT_RULES):
+    if isinstance(stats, dict):
+        stats = summarize(stats, rules = rules)
+    chances = holeTenChances(stats, exact, rules)
+    table = {}
+    for count in range(MIN_COUNT, MAX_COUNT + 1):
+        chance = chances[count - MIN_COUNT + 1]
+        if not np.isnan(chance):
+            expectation = float(3*chance - 1)
+            table[count] = (expectation > 0, expectation)
+    return table
 
 
 """
 Evaluates expected profit of inert hands 
 based on the likelihood of winning, losing and pushing
-with the dealer
+with the dealer.
+If exact is True, the dealer's chances come from dealer.py instead of
+the tallies, using a shoe at the bucket's count.
 """        
-def standExpectations(stand):
-    for key in stand:
-        b = stand[key]
+def standExpectations(stats, stand, expectations, exact = False, rules = DEFAULT_RULES):
+    keys = np.flatnonzero(stand)
+    payoff = np.where(KEY_VALUE[keys] == 21.5, rules.blackjackPayout, 1)
+    expectations[keys] = (payoff*stats.wins[keys] - stats.losses[keys])/stats.counts[keys]
+    expectations[keys[KEY_VALUE[keys] == -1]] = -1
+    if exact:
+        for keyIndex in keys:
+            value, _, _, _, _, upCard, count = decodeKey(keyIndex)
+            if value == -1:
+                continue
+            if upCard is None: # a blackjack against a dealer who can't have one
+                expectations[keyIndex] = rules.blackjackPayout
+            else:
+                expectations[keyIndex] = dealer.standExpectation(value, upCard, bucketComposition(upCard, count, rules.decks),
+                                                                 rules.hitSoft17, rules.blackjackPayout)
+
+"""
+the shoe we assume a bucket was dealt from: a typical half-played shoe
+at the middle of the bucket's true count range, with the upCard removed
+"""
+def bucketComposition(upCard, count, decks = DECKS_PER_SHOE):
+    composition = dealer.countComposition(count + 0.5, decks/2)
+    return dealer.removeCards(composition, [upCard])
 
-        payoff = 1
-        if b.key[0] == 21.5:
-            payoff = 1.5
+"""
+the average expectation of the children of each of keys (sorted),
+weighted by how often each child occurred. Only the transitions for
+which keep is true count; keys with no such transitions get NaN.
+"""
+def childExpectation(transitions, keys, expectations, children = None, keep = None):
+    if children is None:
+        children = transitions.children
+    mine = np.isin(transitions.parents, keys)
+    if keep is not None:
+        mine &= keep
+    positions = np.searchsorted(keys, transitions.parents[mine])
+    weights = transitions.counts[mine]
+    total = np.bincount(positions, weights = weights, minlength = len(keys))
+    weighted = np.bincount(positions, weights = weights*expectations[children[mine]], minlength = len(keys))
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return weighted/total
 
-        if b.key[0] == -1:
-            b.expectation = -1
+"""
+Evaluates expected profit of the hittable buckets keys (all of one category
+and value) from the expectations of the buckets their blocks move to when
+they stand, hit, double or split.
+"""
+def setExpectations(stats, keys, expectations, bestChoices, rules = DEFAULT_RULES):
+    stExp = expectations[STAND_KEY[keys]]
+    hitExp = childExpectation(stats.hit, keys, expectations)
 
-        else:
-            numWon = 0
-            numLost = 0
-            for block in b.blocks:
-                dealerHand = [block.upCard, block.dCard]
-                remaining = block.extraCards
-                dTotal = dealerPlay(dealerHand, remaining)
-                pTotal = block.hand.value
+    doubleExp = np.full(len(keys), -2.0)
+    splitExp = np.full(len(keys), -2.0)
+    # the processes for splitting and doubling are a little complicated:
+    canDouble = KEY_CAN_DOUBLE[keys]
+    if canDouble.any():
+        doubleExp = np.where(canDouble, 2*childExpectation(stats.double, keys, expectations), -2)
 
-                if pTotal > dTotal: numWon += 1
-                elif pTotal < dTotal: numLost += 1
+    if KEY_CAN_SPLIT[keys].any():
+        splitExp = splitExpectations(stats, keys, expectations, rules)
 
-            numBlocks = len(b.blocks)
-            b.expectation = (payoff*numWon - numLost)/numBlocks
+    expectation = np.maximum.reduce([splitExp, doubleExp, hitExp, stExp])
+    expectations[keys] = expectation
+    bestChoices[keys] = np.select(
+        [expectation == hitExp, expectation == stExp, expectation == doubleExp],
+        [HIT, STAND, DOUBLE], SPLIT)
 
 """
-Evaluates expected profit for high hard hands
-based on the likelihood of winning if we stand or hit
+Splitting, as a tree over the number of hands in the round. Every split
+hand is the pair card plus the next card, as recorded in the split
+transitions, and is worth
+    (a) for split Aces, standing on it (a split 21 is no blackjack)
+    (b) otherwise, playing it on: with doubling if rules.doubleAfterSplit,
+        and only standing or hitting if not
+    (c) when it is the pair again, the better of playing it on and
+        splitting it once more, if rules.canSplit allows that with one
+        more hand in the round (rules.maxHands, rules.resplitAces)
+so with value(n) the average worth of one split hand in a round of n
+hands, splitting is worth 2*value(2), and resplitting a hand of a round of
+n hands is worth 2*value(n + 1). value(n) is worked out once per pair
+bucket for every n, from the most hands down (MAX_SPLIT_HANDS when there
+is no limit), and every hand of the tree reads the same expectation
+arrays, so sibling hands share the dealer outcomes the stand buckets
+tallied rather than sampling their own. A resplit pair is taken to be
+worth what its parent is.
+A split child only counts if we have data on it.
 """
-#TODO: incorportate double and splitting procedures to setExpectation
-def setExpectation(split, double, low, soft, high, stand, value, canSplit, isSoft, canDouble, myHome, upCard, count):
-    
-    currentKey = (value, canSplit, isSoft, canDouble, True, hardValue([upCard]), count)
-    if currentKey not in myHome:
-        # print("ignoring:")
-        # print(currentKey)
-        return
-    currentBucket = myHome[currentKey]
-
-    standKey = currentBucket.blocks[0].stChild.key
-    stExp = stand[standKey].expectation
-
-    hChildKeyFreqs = {}
-
-    for block in currentBucket.blocks:
-        occurrence = block.hChild.key
-        if occurrence in hChildKeyFreqs:
-            hChildKeyFreqs[occurrence] += 1
-        else:
-            hChildKeyFreqs[occurrence] = 1
-
-    def contribution(key, frequencies):
-        location = None
-        if key in stand: location = stand
-        elif key in high: location = high
-        elif key in soft: location = soft
-        elif key in low: location = low
-        elif key in double: location = double
-        elif key in split: location = split
-        return frequencies[key]*location[key].expectation
-
-    hitExp = sum([contribution(key,hChildKeyFreqs) for key in hChildKeyFreqs])/len(currentBucket.blocks)
-
-    doubleExp = -2
-    splitExp = -2
-    # the processes for splitting and doubling are a little complicated:
-    if canDouble:
-        dChildKeyFreqs = {}
-        for block in currentBucket.blocks:
-            if block.hChild.stChild:
-                occurrence = block.hChild.stChild.key
-            else:
-                occurrence = block.hChild.key
-            if occurrence in dChildKeyFreqs:
-                dChildKeyFreqs[occurrence] += 1
-            else:
-                dChildKeyFreqs[occurrence] = 1
-        doubleExp = 2*sum([contribution(key,dChildKeyFreqs) for key in dChildKeyFreqs])/len(currentBucket.blocks)
-
-    if canSplit:
-        legacyCard = currentBucket.hand.value // 2
-        if isSoft:
-            legacyCard = "A"
-
-        splChildFreqs = {}
-        numKeys = 0
-        for block in currentBucket.blocks:
-            # Note: we are guaranteed at least two extraCards, for a splittable hand
-            nextCards = [block.extraCards[0], block.extraCards[1]]
-            hand1 = Hand([legacyCard,nextCards[0]])
-            hand2 =  Hand([legacyCard, nextCards[1]])
-            countShift = countValue(nextCards[0]) + countValue(nextCards[1])
-            key1 = Block(hand1, block.upCard, block.dCard, None, block.rc + countShift, block.numCardsDealt + 2).key
-            key2 = Block(hand2, block.upCard, block.dCard, None, block.rc + countShift, block.numCardsDealt + 2).key
-            for key in (key1, key2):
-                if key == currentKey: # if we split into the same hand, we should ignore the child.
-                    continue
-                if key not in double: # only occurs if our coverage is not total
-                    # print("don't have data on:")
-                    # print(key)
-                    continue
-
-                if legacyCard == "A": # typically, must stand after splitting aces
-                    key = double[key].blocks[0].stChild.key
-                if key in splChildFreqs:
-                    splChildFreqs[key] += 1
-                else:
-                    splChildFreqs[key] = 1
-                numKeys += 1
-        if numKeys == 0:
-            splitExp = -10
-        else:
-            splitExp = 2*sum([contribution(key, splChildFreqs) for key in splChildFreqs])/numKeys
+def splitExpectations(stats, keys, expectations, rules = DEFAULT_RULES):
+    split = stats.split
+    mine = np.isin(split.parents, keys)
+    parents = split.parents[mine]
+    children = split.children[mine]
+    weights = split.counts[mine].astype(float)
+    aces = KEY_IS_SOFT[parents]
+    isPair = KEY_CAN_SPLIT[children]
+
+    # a split hand of two cards to 21 is no blackjack, just a 21 to stand on.
+    # Its natural key has lost the count, so the parent's stands in for it.
+    naturals = KEY_VALUE[children] == 21.5
+    standKeys = np.where(naturals, plainKey(21, KEY_UPCARD[parents], KEY_COUNT_INDEX[parents]), STAND_KEY[children])
+    standExp = expectations[standKeys]
+    # children of the same value as the parent are being worked out right now,
+    # so every child is played on from its own hit and double transitions
+    uniqueChildren, childIndex = np.unique(children, return_inverse = True)
+    playOn = np.fmax(standExp, childExpectation(stats.hit, uniqueChildren, expectations)[childIndex])
+    if rules.doubleAfterSplit:
+        playOn = np.fmax(playOn, 2*childExpectation(stats.double, uniqueChildren, expectations)[childIndex])
+    playOn = np.where(aces, standExp, playOn)
+    keep = ~np.isnan(playOn) & (stats.counts[children] > 0)
+
+    positions = np.searchsorted(keys, parents[keep])
+    total = np.bincount(positions, weights = weights[keep], minlength = len(keys))
+    pairWeight = np.bincount(positions, weights = (weights*isPair)[keep], minlength = len(keys))
+    otherSum = np.bincount(positions, weights = (weights*~isPair*np.nan_to_num(playOn))[keep], minlength = len(keys))
+    pairSum = np.bincount(positions, weights = (weights*isPair*np.nan_to_num(playOn))[keep], minlength = len(keys))
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        pairPlayOn = pairSum/pairWeight
+
+    pairAces = KEY_IS_SOFT[keys]
+    pairCards = np.where(pairAces, ACE, (KEY_VALUE[keys]//2).astype(np.int64))
+    mostHands = rules.maxHands if rules.maxHands else MAX_SPLIT_HANDS
+    value = np.full(len(keys), np.nan)
+    for numHands in range(mostHands, 1, -1):
+        resplit = np.array([rules.canSplit(card, numHands) and numHands < mostHands for card in pairCards.tolist()], dtype=bool)
+        pairValue = np.where(resplit & ~np.isnan(value), np.fmax(pairPlayOn, 2*value), pairPlayOn)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            value = (otherSum + pairWeight*np.nan_to_num(pairValue))/total
+    splitExp = 2*value
+    return np.where(np.isnan(splitExp), -10, splitExp)
 
-    currentBucket.expectation = max(splitExp, doubleExp, hitExp, stExp)
+"""
+the key index of a stood hand of value against upCard, at count index countIndex
+"""
+def plainKey(value, upCard, countIndex):
+    valueIndex = value + 2
+    return (valueIndex*16*NUM_UPCARDS + upCard)*NUM_COUNTS + countIndex
 
-    if currentBucket.expectation == hitExp:
-        currentBucket.bestChoice = "hit"
-    elif currentBucket.expectation == stExp:
-        currentBucket.bestChoice = "stand"
-    elif currentBucket.expectation == doubleExp:
-        currentBucket.bestChoice = "double"
+"""
+Builds the BucketStats of numShoes shoes in shards of SHOES_PER_SHARD.
+Each shard is dealt by its own worker with its own seeded RNG and comes
+back already summarized, so only the compact statistics cross between
+processes, never the blocks. The result depends on seed but not on numWorkers.
+The shoes are numbered on from start (the shoes dealt before, say into a
+bucket store), and each shard's RNG is keyed on the number of its first
+shoe, so the same seed deals different shoes past a different start.
+Given a shoebank.ShoeBank, the shards take its shoes in order from start
+instead of shuffling.
+"""
+def makeStats(numShoes, numWorkers = None, seed = None, rules = DEFAULT_RULES, bank = None, start = 0):
+    shardSizes = [SHOES_PER_SHARD]*(numShoes // SHOES_PER_SHARD)
+    if numShoes % SHOES_PER_SHARD:
+        shardSizes.append(numShoes % SHOES_PER_SHARD)
+    starts = np.cumsum([start] + shardSizes[:-1]).tolist()
+    entropy = np.random.SeedSequence(seed).entropy
+    seeds = [np.random.SeedSequence(entropy, spawn_key = (shardStart,)) for shardStart in starts]
+    if bank is not None and bank.decks != rules.decks:
+        raise ValueError("the shoe bank holds " + str(bank.decks) + "-deck shoes, but the rules play " + str(rules.decks))
+    if numWorkers is None:
+        numWorkers = os.cpu_count()
+    total = BucketStats()
+    if numWorkers <= 1 or len(shardSizes) <= 1:
+        for shardSize, seedSequence, shardStart in zip(shardSizes, seeds, starts):
+            total.merge(makeShard(shardSize, seedSequence, rules, bank, shardStart))
     else:
-        currentBucket.bestChoice = "split"
-
-def highExpectations(high, stand):
-    for upCard in SUITS:
-        for i in range(21, 10, -1):
-            for count in range(MIN_COUNT, MAX_COUNT + 1):
-                isSoft = False
-                myHome = high
-                setExpectation(None, None, None, None, high, stand,i, False, isSoft, False, myHome, upCard, count)
-            
-def softExpectations(soft, high, stand):
-    for upCard in SUITS:
-        for i in range(21, 12, -1): # we operate in reverse because we want to build from simple (21) to complex (12)
-            for count in range(MIN_COUNT, MAX_COUNT + 1):
-                isSoft = True
-                myHome = soft
-                setExpectation(None, None, None, soft, high, stand, i, False, isSoft, False, myHome, upCard, count)
-
-def lowExpectations(low, soft, high, stand):
-    for upCard in SUITS:
-        for i in range(10, 5, -1):
-            for count in range(MIN_COUNT, MAX_COUNT + 1):
-                isSoft = False
-                myHome = low
-                setExpectation(None, None, low, soft, high, stand, i, False, isSoft, False, myHome, upCard, count)
-
-def doubleExpectations(double, low, soft, high, stand):
-    for key in double:
-        value = double[key].hand.value
-        isSoft = double[key].hand.isSoft
-        upCard = double[key].upCard
-        count = double[key].count
-        setExpectation(None, double, low, soft, high, stand, value, False, isSoft, True, double, upCard, count)
-
-def splitExpectations(split, double, low, soft, high, stand):
-    for key in split:
-        value = split[key].hand.value
-        isSoft = split[key].hand.isSoft
-        upCard = split[key].upCard
-        count = split[key].count
-        setExpectation(split, double, low, soft, high, stand, value, True, isSoft, True, split, upCard, count)
-
-"""
-right now, this is just a testing function
-"""
-
-def main(n):
-    buckets = makeBuckets(n)
-    makeExpectations(buckets)
+        # keep only a few shards in flight so pending results don't pile up
+        with ProcessPoolExecutor(max_workers = numWorkers) as pool:
+            pending = []
+            for shardSize, seedSequence, shardStart in zip(shardSizes, seeds, starts):
+                pending.append(pool.submit(makeShard, shardSize, seedSequence, rules, bank, shardStart))
+                if len(pending) >= 2*numWorkers:
+                    total.merge(pending.pop(0).result())
+            for future in pending:
+                total.merge(future.result())
+    return total
+
+def makeShard(numShoes, seedSequence, rules = DEFAULT_RULES, bank = None, start = 0):
+    if bank is None:
+        rng = random.Random(int(seedSequence.generate_state(1)[0]))
+    else:
+        rng = bank.stream(start)
+    return summarize(makeBuckets(numShoes, rng, rules), numShoes, rules)
+
+"""
+the {key: (bestChoice, expectation)} dictionary of every decision we have data on
+"""
+def strategyTable(stats, exact = False, rules = DEFAULT_RULES):
+    expectations, bestChoices = makeExpectations(stats, exact, rules)
     strategy = {}
-    for key in buckets:
-        if buckets[key].hand.canHit:
-            strategy[key] = (buckets[key].bestChoice, buckets[key].expectation)
-    return (buckets, strategy)
\ No newline at end of file
+    for key in np.flatnonzero(divide(stats)[0] == False):
+        if stats.counts[key] > 0:
+            strategy[decodeKey(key)] = (CHOICES[bestChoices[key]], float(expectations[key]))
+    return strategy
+
+"""
+right now, this is just a testing function.
+The n shoes are spread over numWorkers processes (all cores by default).
+If cacheDir is given, the statistics of earlier runs stored there (for the
+same rules) are merged with the n new shoes and written back. The new shoes
+follow on from the ones the store already holds, from the bank or from
+seed's RNGs past them, so reruns don't sample the same shoes twice, even
+with the same seed.
+Of the rules, the decks and soft 17 decide the buckets, and surrender, the
+blackjack payout, doubling after a split and resplitting (see
+splitExpectations) are applied when the expectations are worked out.
+surrenderTable(stats) and insuranceTable(stats) give the surrender and
+insurance decisions to go with the strategy.
+"""
+
+def main(n, exact = False, cacheDir = None, numWorkers = None, seed = None, rules = DEFAULT_RULES, bank = None):
+    stored = None
+    if cacheDir is not None:
+        path = cachePath(cacheDir, rules)
+        if os.path.exists(path):
+            stored = loadBucketStats(path, rules)
+    stats = makeStats(n, numWorkers, seed, rules, bank, 0 if stored is None else stored.numShoes)
+    if cacheDir is not None:
+        if stored is not None:
+            stats.merge(stored)
+        stats.save(path, rules)
+    return (stats, strategyTable(stats, exact, rules))
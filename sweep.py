@@ -0,0 +1,237 @@
+"""
+Simulating many variants of the game in one run.
+
+A sweep plays the same number of games of histo.newGame under each of a
+list of variants. A variant is a dictionary of
+
+    (a) any rules.Rules fields (decks, hitSoft17, surrender, ...); the rest
+        keep their DEFAULT_RULES values
+    (b) "strategy": "basic" (policy.basicStrategy), "solved" (solver.solveRules)
+        or "buckets" (sampled with strategy.main); "basic" by default
+    (c) "spread": the arguments of a betting.BetSpread (units, fractions,
+        tableMin, tableMax) as a dictionary, or None to bet flat
+        (histo.FLAT_SPREAD). "ramp", a ramp of multipliers on histo's flat
+        bet indexed as stats.tcIndex, is short for the proportionalRamp spread
+
+and grid builds a list of them from every combination of the values given
+for each key.
+
+Every variant's games are chunked as in histo.histogram, and chunk i of
+every variant is seeded from the same spawned SeedSequence, so variants
+with the same number of decks are dealt the same sequence of shoes (common
+random numbers): the differences between them are down to the rules and
+the strategy rather than the luck of the deal. Jobs of one chunk are
+submitted for all the variants before the next chunk, and fan out over a
+ProcessPoolExecutor.
+
+Each finished chunk is written straight into the results file, a single
+.npy array memory mapped with one row per column of COLUMNS and one entry
+per game of every variant, so each column reads back contiguously. The
+variants and seed go in a JSON file next to it. Games not played yet are
+NaN, and running the same sweep again on the same path plays only those.
+
+Strategy tables are worked out once per sweep for each set of rules they
+depend on and sent with the jobs: solved and bucket strategies depend on
+the decks, the dealer's soft 17 and the split rules (doubleAfterSplit,
+maxHands, resplitAces), plus whether surrender is offered, so variants differing in any other rule or the bet spread
+share one table. Bucket statistics are sampled once per strategy.ruleConfig
+(and kept in cacheDir, if given, for later sweeps).
+"""
+from concurrent.futures import ProcessPoolExecutor
+import dataclasses
+import itertools
+import json
+import os
+import numpy as np
+import policy
+import solver
+import strategy
+import betting
+from histo import BANKROLL, BETTING_UNIT, GAMES_PER_CHUNK, newGame
+from rules import Rules, DEFAULT_RULES
+
+COLUMNS = ("variant", "game", "profit", "lowest")
+STRATEGIES = ("basic", "solved", "buckets")
+RULE_FIELDS = tuple(field.name for field in dataclasses.fields(Rules))
+
+
+"""
+every combination of the values given for each key, as a list of variants.
+grid(decks = [2, 6], hitSoft17 = [False, True]) gives four variants.
+"""
+def grid(**axes):
+    keys = list(axes)
+    return [dict(zip(keys, values)) for values in itertools.product(*(axes[key] for key in keys))]
+
+def variantRules(variant):
+    for key in variant:
+        if key not in RULE_FIELDS and key not in ("strategy", "spread", "ramp"):
+            raise ValueError("unknown variant key " + repr(key))
+    if variant.get("strategy", "basic") not in STRATEGIES:
+        raise ValueError("strategy must be one of " + str(STRATEGIES) + ", not " + repr(variant["strategy"]))
+    variantSpread(variant)
+    return Rules(**{key: value for key, value in variant.items() if key in RULE_FIELDS})
+
+"""
+the betting.BetSpread a variant bets with, or None for histo's flat bet
+"""
+def variantSpread(variant):
+    if variant.get("spread") is not None and variant.get("ramp") is not None:
+        raise ValueError("a variant takes a spread or a ramp, not both")
+    if variant.get("spread") is not None:
+        return betting.BetSpread(**variant["spread"])
+    if variant.get("ramp") is not None:
+        return betting.proportionalRamp(variant["ramp"], BETTING_UNIT/BANKROLL)
+    return None
+
+"""
+Plays every variant for numIters games and writes the results to path (a
+.npy file, with the variants in path + ".json"). Returns the variants and
+the results, as loadSweep. seed is shared by all the variants; counts are
+the true counts solved for the "solved" strategy and strategyShoes the
+shoes sampled for "buckets".
+"""
+def sweep(variants, numIters, path, numWorkers = None, seed = None, counts = (0,), strategyShoes = 10000, cacheDir = None):
+    variants = [dict(variant) for variant in variants]
+    for variant in variants:
+        if variant.get("ramp") is not None:
+            variant["ramp"] = [float(x) for x in variant["ramp"]]
+        if variant.get("spread") is not None:
+            variant["spread"] = {key: ([float(x) for x in value] if np.ndim(value) else float(value))
+                                 for key, value in variant["spread"].items()}
+    allRules = [variantRules(variant) for variant in variants]
+    header = {"variants": variants, "numIters": numIters, "columns": COLUMNS}
+    numRows = len(variants)*numIters
+    if os.path.exists(path) and os.path.exists(path + ".json"):
+        with open(path + ".json") as f:
+            saved = json.load(f)
+        if {key: saved[key] for key in header} != json.loads(json.dumps(header)):
+            raise ValueError("results file " + path + " holds a different sweep")
+        entropy = saved["entropy"]
+        results = np.lib.format.open_memmap(path, mode = "r+")
+    else:
+        entropy = np.random.SeedSequence(seed).entropy
+        results = np.lib.format.open_memmap(path, mode = "w+", dtype = np.float64, shape = (len(COLUMNS), numRows))
+        results[:] = np.nan
+        results[COLUMNS.index("variant")] = np.repeat(np.arange(len(variants)), numIters)
+        results[COLUMNS.index("game")] = np.tile(np.arange(numIters), len(variants))
+        results.flush()
+        with open(path + ".json", "w") as f:
+            json.dump(dict(header, entropy = entropy), f)
+
+    chunkSizes = [GAMES_PER_CHUNK]*(numIters // GAMES_PER_CHUNK)
+    if numIters % GAMES_PER_CHUNK:
+        chunkSizes.append(numIters % GAMES_PER_CHUNK)
+    starts = np.concatenate([[0], np.cumsum(chunkSizes)]).astype(int)
+    seeds = np.random.SeedSequence(entropy).spawn(len(chunkSizes))
+    profits = results[COLUMNS.index("profit")]
+    jobs = []
+    for i in range(len(chunkSizes)):
+        for v in range(len(variants)):
+            first = v*numIters + starts[i]
+            if np.isnan(profits[first:first + chunkSizes[i]]).any():
+                jobs.append((v, i))
+
+    tables = {}
+    bucketStats = {}
+    for v, i in jobs:
+        key = tableKey(variants[v], allRules[v])
+        if key not in tables:
+            tables[key] = makeTable(variants[v], allRules[v], counts, strategyShoes, cacheDir, bucketStats)
+
+    def record(job, chunk):
+        v, i = job
+        first = v*numIters + starts[i]
+        results[COLUMNS.index("profit"), first:first + chunkSizes[i]] = chunk[0]
+        results[COLUMNS.index("lowest"), first:first + chunkSizes[i]] = chunk[1]
+        results.flush()
+
+    def arguments(job):
+        v, i = job
+        return (chunkSizes[i], seeds[i], tables[tableKey(variants[v], allRules[v])], allRules[v], variantSpread(variants[v]))
+
+    if numWorkers is None:
+        numWorkers = os.cpu_count()
+    if numWorkers <= 1:
+        for job in jobs:
+            record(job, playChunk(*arguments(job)))
+    else:
+        # keep only a few chunks in flight, as histo.streamGames
+        with ProcessPoolExecutor(max_workers = numWorkers) as pool:
+            pending = []
+            for job in jobs:
+                pending.append((job, pool.submit(playChunk, *arguments(job))))
+                if len(pending) >= 2*numWorkers:
+                    job, future = pending.pop(0)
+                    record(job, future.result())
+            for job, future in pending:
+                record(job, future.result())
+    return loadSweep(path)
+
+"""
+the variants of the sweep saved at path, and its results as a dictionary
+of read-only columns
+"""
+def loadSweep(path):
+    with open(path + ".json") as f:
+        variants = json.load(f)["variants"]
+    results = np.load(path, mmap_mode = "r")
+    return variants, {name: results[i] for i, name in enumerate(COLUMNS)}
+
+"""
+what the variant's strategy table depends on: variants with the same key
+play the same table
+"""
+def tableKey(variant, rules):
+    kind = variant.get("strategy", "basic")
+    if kind == "basic":
+        return (kind, rules.surrender)
+    return (kind, rules.decks, rules.hitSoft17, rules.doubleAfterSplit, rules.maxHands, rules.resplitAces, rules.surrender)
+
+def makeTable(variant, rules, counts, strategyShoes, cacheDir, bucketStats):
+    kind = variant.get("strategy", "basic")
+    base = policy.basicStrategy(rules)
+    if kind == "basic":
+        return base
+    if kind == "solved":
+        choices = solver.solveRules(rules, tuple(counts))
+        surrender = solver.surrenderRules(rules, tuple(counts))
+    else:
+        config = strategy.ruleConfig(rules)
+        if config not in bucketStats:
+            bucketStats[config] = strategy.main(strategyShoes, cacheDir = cacheDir, rules = rules)[0]
+        choices = strategy.strategyTable(bucketStats[config], rules = rules)
+        surrender = strategy.surrenderTable(bucketStats[config], rules = rules)
+    table = policy.fromStrategy(choices, base, surrender = surrender)
+    if rules.surrender == "none":
+        table.surrender[:] = False
+        table.compile()
+    return table
+
+"""
+the per-game recorder newGame reports to; only the games are kept
+"""
+class GameRecorder:
+    def __init__(self, numGames):
+        self.profits = np.empty(numGames)
+        self.lowests = np.empty(numGames)
+        self.numGames = 0
+
+    def addRound(self, profit, bet, tc):
+        pass
+
+    def addGame(self, profit, lowestBankroll):
+        self.profits[self.numGames] = profit
+        self.lowests[self.numGames] = lowestBankroll
+        self.numGames += 1
+
+"""
+plays numGames games of one variant with an RNG built from seedSequence,
+and returns their profits and lowest bankrolls
+"""
+def playChunk(numGames, seedSequence, table, rules = DEFAULT_RULES, spread = None):
+    rng = np.random.default_rng(seedSequence)
+    recorder = GameRecorder(numGames)
+    for i in range(numGames):
+        newGame(rng, recorder, table, rules, spread)
+    return recorder.profits, recorder.lowests